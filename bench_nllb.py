@@ -0,0 +1,131 @@
+"""NLLB 벤치마크: CPU 샤딩 스케일링(워커 1 → N개) / 디코딩 설정별 배치 지연시간
+
+사용 예:
+    python bench_nllb.py --srt sample.srt --max-workers 32
+    python bench_nllb.py --model facebook/nllb-200-distilled-600M --lines 512
+    python bench_nllb.py --bench decode --model facebook/nllb-200-3.3B --batch-size 64 --compile
+"""
+import os
+import time
+import argparse
+import statistics
+
+import torch
+
+import utils
+import trans_nllb
+
+SAMPLE_LINES = [
+    "Where were you last night?",
+    "I told you, I was at the office until midnight.",
+    "Don't lie to me.",
+    "We need to leave before the storm hits.",
+    "Is anyone there?",
+    "The train leaves at seven, so hurry up.",
+    "I never thought I'd see you again.",
+    "Give me the keys.",
+]
+
+def load_lines(srt_path, n_lines):
+    if srt_path:
+        with open(srt_path, encoding="utf-8", errors="ignore") as f:
+            lines = [utils.clean_text(r[2]) for r in utils.parse_srt(f.read())]
+        lines = [t for t in lines if t]
+    else:
+        lines = SAMPLE_LINES
+    # 캐시/중복 제거 효과를 배제하기 위해 모든 줄을 고유하게 만듦
+    return [f"{lines[i % len(lines)]} ({i})" for i in range(n_lines)]
+
+def worker_steps(max_workers):
+    steps, w = [], 1
+    while w < max_workers:
+        steps.append(w)
+        w *= 2
+    return steps + [max_workers]
+
+def legacy_generate(tok, mdl, batch_src, device, decode=None):
+    """기존 방식 (고정 max_new_tokens, 기본 디코딩) 비교 기준"""
+    src_lang, _ = utils.detect_language(batch_src[0])
+    tok.src_lang = src_lang
+    with torch.no_grad():
+        inputs = tok(batch_src, return_tensors="pt", padding=True).to(device)
+        gen = mdl.generate(**inputs, forced_bos_token_id=tok.convert_tokens_to_ids("kor_Hang"),
+                           max_new_tokens=trans_nllb.MAX_NEW_TOKENS)
+        return tok.batch_decode(gen, skip_special_tokens=True)
+
+def compile_count():
+    """지금까지 dynamo가 컴파일한 그래프 수 (재컴파일 포함, 지원하지 않는 torch는 0)"""
+    try:
+        from torch._dynamo.utils import counters
+    except ImportError:
+        return 0
+    return counters["stats"]["unique_graphs"]
+
+def time_batches(generate, tok, mdl, texts, batch_size, decode):
+    device = trans_nllb.DEVICE
+    latencies = []
+    for p in range(0, len(texts), batch_size):
+        t0 = time.perf_counter()
+        generate(tok, mdl, texts[p : p + batch_size], device, decode)
+        if device == "cuda": torch.cuda.synchronize()
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+def bench_decode(args, texts):
+    """디코딩 설정별 배치 지연시간 / cues/sec / 측정 중 재컴파일 수 (모델 로드 + 워밍업은 측정 제외)"""
+    settings = [("legacy (fixed 256)", False, None)]
+    settings += [(f"{mode}", False, mode) for mode in trans_nllb.DECODE_PRESETS]
+    if args.compile:
+        settings += [(f"{mode} + compile", True, mode) for mode in trans_nllb.DECODE_PRESETS]
+
+    print(f"model={args.model} device={trans_nllb.DEVICE} lines={len(texts)} batch={args.batch_size}")
+    print(f"{'setting':>22} {'mean ms':>9} {'p95 ms':>9} {'cues/s':>8} {'recompiles':>10}")
+    loaded = {}
+    for name, compile, decode in settings:
+        if compile not in loaded:
+            loaded.clear()
+            utils.clear_vram()
+            loaded[compile] = trans_nllb._load(args.model, trans_nllb.DEVICE, compile)
+        tok, mdl = loaded[compile]
+        generate = legacy_generate if decode is None else trans_nllb._generate
+        generate(tok, mdl, texts[: args.batch_size], trans_nllb.DEVICE, decode)  # 설정별 워밍업
+        graphs = compile_count()
+        lat = time_batches(generate, tok, mdl, texts, args.batch_size, decode)
+        recompiles = compile_count() - graphs
+        p95 = sorted(lat)[max(0, int(len(lat) * 0.95) - 1)]
+        print(f"{name:>22} {statistics.mean(lat) * 1000:>9.0f} {p95 * 1000:>9.0f} {len(texts) / sum(lat):>8.1f} {recompiles:>10}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--bench", choices=["scaling", "decode"], default="scaling")
+    ap.add_argument("--model", default="facebook/nllb-200-distilled-600M")
+    ap.add_argument("--srt", help="벤치마크에 사용할 SRT 파일 (없으면 샘플 문장)")
+    ap.add_argument("--lines", type=int, default=256)
+    ap.add_argument("--max-workers", type=int, default=max(1, trans_nllb.available_cores() // 4))
+    ap.add_argument("--batch-size", type=int, default=trans_nllb.CPU_BATCH_SIZE)
+    ap.add_argument("--compile", action="store_true", help="decode 벤치에 torch.compile 경로 포함")
+    args = ap.parse_args()
+
+    texts = load_lines(args.srt, args.lines)
+    if args.bench == "decode":
+        bench_decode(args, texts)
+        return
+
+    print(f"model={args.model} lines={len(texts)} batch={args.batch_size} cores={trans_nllb.available_cores()}")
+    print(f"{'workers':>8} {'threads':>8} {'sec':>8} {'cues/s':>8} {'speedup':>8}")
+
+    base = None
+    for w in worker_steps(args.max_workers):
+        pool = trans_nllb.CpuPool(args.model, w, args.batch_size)
+        pool.run(texts[: args.batch_size * w])  # 모델 로딩 + 워밍업 (측정 제외)
+        t0 = time.perf_counter()
+        pool.run(texts)
+        sec = time.perf_counter() - t0
+        pool.close()
+
+        rate = len(texts) / sec
+        base = base or rate
+        print(f"{w:>8} {pool.threads:>8} {sec:>8.1f} {rate:>8.1f} {rate / base:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+import os
+import io
+import json
+import uuid
+import time
+import sqlite3
+import hashlib
+import zipfile
+import asyncio
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import utils
+import trans_nllb
+import trans_gemini
+import trans_deepl
+import trans_claude
+import pipeline
+import validator
+
+# ======================
+# CONFIG
+# ======================
+DB_PATH = os.getenv("SUBTRANS_JOB_DB", "jobs.db")
+POLL_INTERVAL = 1.0     # 워커가 큐를 확인하는 주기 (초)
+API_WORKERS = 3         # API 엔진은 병렬 실행, GPU 엔진은 항상 1개씩 직렬 실행
+JOB_TTL_DAYS = 7        # 끝난 작업(업로드 원문 + 결과 ZIP)을 DB에 보관하는 기간
+
+NLLB_MODEL_ID = os.getenv("NLLB_MODEL_ID", "facebook/nllb-200-3.3B")
+
+ENGINES = {
+    # engine: (lane, 결과 ZIP 이름, API Key 환경변수)
+    "nllb": ("gpu", "NLLB_Translated.zip", None),
+    "gemini": ("api", "Gemini_Translated.zip", "GEMINI_API_KEY"),
+    "deepl": ("api", "DeepL_Translated.zip", "DEEPL_API_KEY"),
+    "claude": ("api", "Claude_Translated.zip", "CLAUDE_API_KEY"),
+    # NLLB 초안 → LLM 교정 파이프라인 (GPU를 점유하므로 gpu lane)
+    "nllb_gemini": ("gpu", "NLLB_Gemini_Translated.zip", "GEMINI_API_KEY"),
+    "nllb_claude": ("gpu", "NLLB_Claude_Translated.zip", "CLAUDE_API_KEY"),
+}
+
+# API Key는 DB에 저장하지 않고 메모리에만 보관 (서버 재시작 시 환경변수로 대체)
+_KEYS = {}
+_started = False
+_start_lock = threading.Lock()
+
+# ======================
+# DB
+# ======================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    session TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    lane TEXT NOT NULL,
+    polish INTEGER NOT NULL DEFAULT 0,
+    merge INTEGER NOT NULL DEFAULT 1,
+    options TEXT NOT NULL DEFAULT '{}',
+    content_hash TEXT NOT NULL,
+    files TEXT NOT NULL,
+    names TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    progress TEXT,
+    report TEXT,
+    result BLOB,
+    error TEXT,
+    created TEXT NOT NULL,
+    started TEXT,
+    finished TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, lane, created);
+CREATE INDEX IF NOT EXISTS idx_jobs_hash ON jobs (content_hash);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    session TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    PRIMARY KEY (session, job_id)
+);
+"""
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+@contextmanager
+def _db():
+    conn = _connect()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def init_db():
+    with _db() as conn:
+        conn.executescript(SCHEMA)
+        # 마이그레이션: options 컬럼이 없던 이전 버전의 jobs.db
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(jobs)")}
+        if "options" not in cols:
+            conn.execute("ALTER TABLE jobs ADD COLUMN options TEXT NOT NULL DEFAULT '{}'")
+        # 이전 프로세스가 죽으면서 남긴 실행 중 작업은 다시 대기열로
+        conn.execute("UPDATE jobs SET status='queued', started=NULL WHERE status='running'")
+    cleanup()
+
+def cleanup():
+    """구독하는 세션이 없는 작업과 JOB_TTL_DAYS보다 오래 전에 끝난 작업 삭제 (실행 중 작업은 유지)"""
+    cutoff = (utils.get_now() - timedelta(days=JOB_TTL_DAYS)).isoformat(timespec="seconds")
+    with _db() as conn:
+        conn.execute(
+            "DELETE FROM jobs WHERE status!='running' AND "
+            "(id NOT IN (SELECT job_id FROM subscriptions) OR finished < ?)",
+            (cutoff,),
+        )
+        conn.execute("DELETE FROM subscriptions WHERE job_id NOT IN (SELECT id FROM jobs)")
+
+def _now():
+    return utils.get_now().isoformat(timespec="seconds")
+
+def content_hash(engine, polish, merge, files, options=None):
+    """파일 내용 + 엔진 + 모드가 같으면 같은 해시 (중복 작업 판별용)"""
+    opts = json.dumps(options or {}, sort_keys=True)
+    h = hashlib.sha256(f"{engine}|{int(polish)}|{int(merge)}|{opts}".encode())
+    for name, text in sorted(files):
+        h.update(b"\0" + name.encode() + b"\0" + text.encode())
+    return h.hexdigest()
+
+# ======================
+# PUBLIC API (UI 쪽)
+# ======================
+def _find_job(conn, c_hash):
+    rows = conn.execute(
+        "SELECT id, status, report FROM jobs WHERE content_hash=? AND status IN ('queued', 'running', 'done') "
+        "ORDER BY created DESC",
+        (c_hash,),
+    ).fetchall()
+    for row in rows:
+        if row["status"] != "done" or json.loads(row["report"] or "{}").get("remaining") == 0:
+            return row["id"]
+    return None
+
+def find_job(c_hash):
+    """같은 해시의 재사용 가능한 작업 id (없으면 None): 대기/진행 중이거나,
+    완료됐고 검증 실패가 남지 않은 작업. 엔진은 API 오류 시 원문을 그대로 돌려주므로
+    실패가 남은 완료 작업은 다시 실행"""
+    with _db() as conn:
+        return _find_job(conn, c_hash)
+
+def submit(session, engine, files, polish=False, merge=True, api_key=None, options=None):
+    """작업 등록. 재사용 가능한 동일 작업(find_job)이 있으면 그 작업에 연결.
+    files: [(파일명, 텍스트), ...], options: 엔진별 추가 인자 (context, concurrency 등)
+    반환: (job_id, 새로 만든 작업인지 여부)"""
+    c_hash = content_hash(engine, polish, merge, files, options)
+    with _db() as conn:
+        # 조회 ~ 구독 등록 사이에 cleanup()이 작업을 지우지 않도록 한 트랜잭션으로
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            job_id = _find_job(conn, c_hash)
+            if job_id:
+                created = False
+            else:
+                job_id, created = uuid.uuid4().hex[:12], True
+                conn.execute(
+                    "INSERT INTO jobs (id, session, engine, lane, polish, merge, options, content_hash, files, names, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, session, engine, ENGINES[engine][0], int(polish), int(merge), json.dumps(options or {}),
+                     c_hash, json.dumps(files, ensure_ascii=False), ", ".join(n for n, _ in files), _now()),
+                )
+            conn.execute("INSERT OR IGNORE INTO subscriptions (session, job_id) VALUES (?, ?)", (session, job_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    if api_key and created:  # 연결만 한 세션의 키로 작성자의 키를 덮어쓰지 않음
+        _KEYS[job_id] = api_key
+    return job_id, created
+
+def list_jobs(session):
+    """세션이 등록(또는 연결)한 작업 목록. 결과 BLOB은 제외"""
+    with _db() as conn:
+        return [dict(r) for r in conn.execute(
+            "SELECT j.id, j.engine, j.polish, j.status, j.progress, j.report, j.error, "
+            "j.created, j.started, j.finished, j.names, "
+            "(SELECT COUNT(*) FROM jobs q WHERE q.status='queued' AND q.lane=j.lane AND q.created<j.created) AS ahead "
+            "FROM jobs j JOIN subscriptions s ON s.job_id=j.id WHERE s.session=? ORDER BY j.created DESC",
+            (session,),
+        )]
+
+def get_result(job_id):
+    with _db() as conn:
+        row = conn.execute("SELECT result FROM jobs WHERE id=?", (job_id,)).fetchone()
+    return row["result"] if row else None
+
+def dismiss(session, job_id):
+    """세션의 작업 목록에서 제거. 다른 세션이 구독 중이면 작업은 유지, 아무도 없으면 삭제"""
+    with _db() as conn:
+        conn.execute("DELETE FROM subscriptions WHERE session=? AND job_id=?", (session, job_id))
+    cleanup()
+
+# ======================
+# WORKER
+# ======================
+class ProgressSink:
+    """엔진이 st.empty()에 쓰던 진행 상황 HTML을 DB에 기록 (UI는 폴링으로 표시)"""
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def markdown(self, body, unsafe_allow_html=False):
+        with _db() as conn:
+            conn.execute("UPDATE jobs SET progress=? WHERE id=?", (body, self.job_id))
+
+    def empty(self):
+        self.markdown("")
+
+def prepare_units(rows, merge, stats):
+    """번역 단위 생성 (Sentence Merge 옵션 반영) 및 병합 통계 누적"""
+    if merge:
+        units, groups = utils.merge_cues(rows)
+    else:
+        units, groups = rows, [[i] for i in range(len(rows))]
+    stats[0] += len(rows)
+    stats[1] += len(units)
+    return units, groups
+
+def _claim(lane):
+    """lane의 다음 작업을 원자적으로 가져옴.
+    세션 간 공정성: 실행 중 작업이 적고, 가장 오래 전에 서비스 받은 세션 우선"""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT j.* FROM jobs j WHERE j.status='queued' AND j.lane=? ORDER BY "
+            "(SELECT COUNT(*) FROM jobs r WHERE r.session=j.session AND r.status='running'), "
+            "COALESCE((SELECT MAX(s.started) FROM jobs s WHERE s.session=j.session), ''), "
+            "j.created LIMIT 1",
+            (lane,),
+        ).fetchone()
+        if row:
+            conn.execute("UPDATE jobs SET status='running', started=?, error=NULL WHERE id=?", (_now(), row["id"]))
+        conn.execute("COMMIT")
+        return dict(row) if row else None
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+def _load_nllb():
+    """NLLB 실행 자원: (tok, mdl, pool). GPU 없는 다코어 노드는 워커 프로세스 풀로 샤딩"""
+    if trans_nllb.DEVICE == "cpu" and trans_nllb.CPU_WORKERS > 1:
+        return None, None, trans_nllb.get_cpu_pool(NLLB_MODEL_ID)
+    tok, mdl = trans_nllb.load_model(NLLB_MODEL_ID)
+    return tok, mdl, None
+
+def _translator(job, sink, report):
+    engine = job["engine"]
+    key_env = ENGINES[engine][2]
+    api_key = _KEYS.get(job["id"]) or (os.getenv(key_env, "") if key_env else None)
+    if key_env and not api_key:
+        raise RuntimeError(f"{key_env} 없음 (서버 재시작 후에는 환경변수의 키만 사용 가능)")
+    polish = bool(job["polish"])
+    options = json.loads(job["options"])
+
+    if engine == "nllb":
+        tok, mdl, pool = _load_nllb()
+        retry_options = {**options, "decode": trans_nllb.RETRY_DECODE}
+        return lambda units, name, idx, total, only=None: trans_nllb.translate(
+            units, tok, mdl, sink, name, idx, total, pool=pool, only=only,
+            **(options if only is None else retry_options))
+    if engine in ("nllb_gemini", "nllb_claude"):
+        tok, mdl, pool = _load_nllb()
+        polish_engine = engine.split("_", 1)[1]
+        return lambda units, name, idx, total, only=None: asyncio.run(pipeline.translate_async(
+            units, tok, mdl, polish_engine, api_key, sink, name, idx, total, pool=pool, report=report, only=only, **options))
+    if engine == "gemini":
+        return lambda units, name, idx, total, only=None: asyncio.run(trans_gemini.translate_async(
+            units, api_key, trans_gemini.GEMINI_MODEL, sink, name, polish, idx, total, only=only, **options))
+    if engine == "deepl":
+        return lambda units, name, idx, total, only=None: asyncio.run(trans_deepl.translate_async(
+            units, api_key, sink, name, idx, total, only=only))
+    if engine == "claude":
+        return lambda units, name, idx, total, only=None: asyncio.run(trans_claude.translate_async(
+            units, api_key, sink, name, polish, idx, total, only=only, **options))
+    raise ValueError(f"Unknown engine: {engine}")
+
+def _validate(job, translate, units, out, name, idx, total, report):
+    """출력 정리 + 검사 후, 실패한 단위만 한 번 더 번역 (지원 엔진만)"""
+    polish = bool(job["polish"])
+    texts = [u[2] for u in units]
+    out, first, checked = validator.validate(texts, out, polish)
+    remaining = first
+    if first and job["engine"] in validator.RETRY_ENGINES:
+        retry = translate(units, name, idx, total, only=set(first))
+        retry, remaining, _ = validator.validate(texts, retry, polish, only=set(first))
+        for i in first:
+            if i not in remaining:
+                out[i] = retry[i]
+    validator.summarize(report, checked, first, remaining)
+    return out
+
+def _execute(job):
+    sink = ProgressSink(job["id"])
+    files = json.loads(job["files"])
+    report = {}
+    translate = _translator(job, sink, report)
+    merge_stats = [0, 0]
+    zip_buf = io.BytesIO()
+
+    with zipfile.ZipFile(zip_buf, "w") as z:
+        for idx, (name, raw_text) in enumerate(files, 1):
+            rows = utils.parse_srt(raw_text)
+            units, groups = prepare_units(rows, job["merge"], merge_stats)
+            out = translate(units, name, idx, len(files))
+            out = _validate(job, translate, units, out, name, idx, len(files), report)
+            z.writestr(f"KR_{name}", utils.build_srt(utils.split_merged(rows, groups, units, out)))
+
+    report.update(cues=merge_stats[0], units=merge_stats[1])
+    return zip_buf.getvalue(), report
+
+def _worker_loop(lane):
+    while True:
+        try:
+            job = _claim(lane)
+        except sqlite3.OperationalError:
+            # DB 잠금 타임아웃 등: 스레드를 죽이지 않고 다음 주기에 재시도
+            traceback.print_exc()
+            job = None
+        if not job:
+            time.sleep(POLL_INTERVAL)
+            continue
+        try:
+            result, report = _execute(job)
+            with _db() as conn:
+                conn.execute(
+                    "UPDATE jobs SET status='done', result=?, report=?, progress=NULL, finished=? WHERE id=?",
+                    (result, json.dumps(report), _now(), job["id"]),
+                )
+        except Exception as e:
+            traceback.print_exc()
+            with _db() as conn:
+                conn.execute(
+                    "UPDATE jobs SET status='failed', error=?, finished=? WHERE id=?",
+                    (f"{type(e).__name__}: {e}", _now(), job["id"]),
+                )
+        finally:
+            _KEYS.pop(job["id"], None)
+            if lane == "gpu":
+                utils.clear_vram()
+        try:
+            cleanup()
+        except sqlite3.OperationalError:
+            traceback.print_exc()
+
+def start_workers():
+    """프로세스당 한 번만 워커 스레드 시작 (Streamlit 재실행에도 유지)"""
+    global _started
+    with _start_lock:
+        if _started: return
+        init_db()
+        threading.Thread(target=_worker_loop, args=("gpu",), name="job-gpu", daemon=True).start()
+        for n in range(API_WORKERS):
+            threading.Thread(target=_worker_loop, args=("api",), name=f"job-api-{n}", daemon=True).start()
+        _started = True
+
+def failure_rates():
+    """완료된 작업 리포트 기준 엔진별 검증 실패율: {engine: (검사 줄 수, 1차 실패율, 최종 실패율)}"""
+    totals = {}
+    with _db() as conn:
+        for row in conn.execute("SELECT engine, report FROM jobs WHERE status='done' AND report IS NOT NULL"):
+            report = json.loads(row["report"])
+            t = totals.setdefault(row["engine"], [0, 0, 0])
+            t[0] += report.get("checked", 0)
+            t[1] += report.get("failed", 0)
+            t[2] += report.get("remaining", 0)
+    return {e: (c, f / c, r / c) for e, (c, f, r) in totals.items() if c}
+
+def job_duration(job):
+    if not job["started"] or not job["finished"]: return ""
+    return utils.format_duration(datetime.fromisoformat(job["started"]), datetime.fromisoformat(job["finished"]))
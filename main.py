@@ -1,15 +1,14 @@
 import streamlit as st
 import os
-import io
-import zipfile
-import asyncio
+import json
+import uuid
 from dotenv import load_dotenv
 
 import utils
-import trans_nllb
-import trans_gemini
 import trans_deepl
-import trans_claude
+import trans_nllb
+import jobs
+import planner
 
 # ======================
 # SETUP & STYLE
@@ -19,6 +18,14 @@ load_dotenv()
 
 st.set_page_config(page_title="Ultra Subtitle Translator", layout="wide", page_icon="🎬")
 
+# 백그라운드 작업 워커 (프로세스당 1회 시작, 새로고침해도 작업 유지)
+jobs.start_workers()
+
+# 새로고침해도 같은 작업 목록을 보도록 세션 ID를 URL에 고정
+if "sid" not in st.query_params:
+    st.query_params["sid"] = uuid.uuid4().hex[:12]
+SESSION_ID = st.query_params["sid"]
+
 # Custom CSS for Premium Look
 st.markdown("""
 <style>
@@ -128,6 +135,64 @@ with st.sidebar:
     else:
         st.metric("DeepL Usage", "Offline", "Check API Key")
 
+    rates = jobs.failure_rates()
+    if rates:
+        st.markdown("#### 🧪 Validator Failure Rate")
+        for engine, (checked, first, final) in rates.items():
+            st.metric(engine.upper().replace("_", " → "), f"{first:.1%}", f"{final:.1%} after retry ({checked:,} lines)",
+                      delta_color="off")
+
+    st.markdown("---")
+    st.markdown("### ⚙️ Options")
+    MERGE_CUES = st.toggle("🧩 Sentence Merge", value=True, help="여러 큐로 나뉜 한 문장을 묶어서 번역한 뒤 원래 타임코드에 다시 분배합니다.")
+
+def read_files(files):
+    return [(f.name, f.getvalue().decode("utf-8", "ignore")) for f in files]
+
+def submit_job(engine, files, api_key=None, polish=False, options=None):
+    """업로드 파일을 작업 큐에 등록 (동일 작업이 있으면 그 작업에 연결)"""
+    job_id, created = jobs.submit(SESSION_ID, engine, read_files(files), polish, MERGE_CUES, api_key, options)
+    if created:
+        st.success(f"📥 Queued job `{job_id}` ({len(files)} files)")
+    else:
+        st.info(f"🔗 Identical job already exists — attached to `{job_id}`")
+
+def fmt_seconds(sec):
+    mins, secs = divmod(int(sec), 60)
+    return f"{mins}분 {secs}초"
+
+def estimate_panel(engine, files, polish, key):
+    """LLM 엔진 설정 + 사전 견적 (요청은 만들기만 하고 보내지 않음). 반환: 엔진 옵션"""
+    default_ctx, default_conc, _, default_batch = planner.ENGINES[engine]
+    with st.expander("💰 Pre-flight Estimate & Settings"):
+        c1, c2, c3, c4 = st.columns(4)
+        context = c1.slider("Context window (±lines)", 1, 8, default_ctx, key=f"{key}_ctx")
+        batch = c2.select_slider("Cues / request", planner.BATCH_CHOICES, default_batch, key=f"{key}_batch")
+        concurrency = c3.select_slider("Concurrency", planner.CONCURRENCY_CHOICES, default_conc, key=f"{key}_conc")
+        budget = c4.number_input("Time budget (min)", 1, 600, 10, key=f"{key}_budget")
+
+        if st.button("Estimate (dry-run)", key=f"{key}_est"):
+            if not files:
+                st.warning("⚠️ Upload SRT files first.")
+            else:
+                payload = read_files(files)
+                p = planner.plan(engine, payload, polish, MERGE_CUES, context, concurrency, batch)
+                if p["dedup_job"]:
+                    st.info(f"🔗 Identical job `{p['dedup_job']}` already exists — no additional cost.")
+                m1, m2, m3, m4 = st.columns(4)
+                m1.metric("Requests", f"{p['requests']:,}", f"{p['cues']:,} cues → {p['units']:,} units")
+                m2.metric("Tokens (in / out)", f"{p['input_tokens']:,}", f"out {p['output_tokens']:,}")
+                m3.metric("Est. Cost", f"${p['cost']:.3f}")
+                m4.metric("Est. Time", fmt_seconds(p["seconds"]), f"{p['latency']:.1f}s / request")
+
+                best, _ = planner.suggest(engine, payload, budget * 60, polish, MERGE_CUES, context)
+                if best:
+                    st.success(f"💡 Cheapest within {budget} min (context ±{best['context']}): {best['batch']} cues/request, "
+                               f"concurrency {best['concurrency']} → ${best['cost']:.3f}, {fmt_seconds(best['seconds'])}")
+                else:
+                    st.warning(f"⚠️ No setting finishes within {budget} min.")
+    return {"context": context, "concurrency": concurrency, "batch": batch}
+
 # ======================
 # MAIN CONTENT
 # ======================
@@ -137,7 +202,8 @@ tab_titles = [
     "🚀 NLLB (Local GPU)", 
     "✨ Gemini Flash (Ultra)", 
     "🌐 DeepL Pro", 
-    "🤖 Claude Sonnet"
+    "🤖 Claude Sonnet",
+    "🔗 NLLB → LLM Polish"
 ]
 tabs = st.tabs(tab_titles)
 
@@ -146,63 +212,27 @@ with tabs[0]:
     col1, col2 = st.columns([3, 1])
     with col1:
         st.info("💡 **Local GPU Powerhouse**: Uses RTX 5080 optimized FP16/CUDA inference. Best for privacy and unlimited usage.")
+    with col2:
+        nllb_decode = st.radio("Decode", list(trans_nllb.DECODE_PRESETS), horizontal=True, key="nllb_decode",
+                               index=list(trans_nllb.DECODE_PRESETS).index(trans_nllb.DECODE_MODE),
+                               help="greedy: 빠름 / beam: 느리지만 더 자연스러운 문장")
     files = st.file_uploader("Upload SRT Files", type=["srt"], accept_multiple_files=True, key="nllb_up")
     
     if st.button("Start NLLB Translation", type="primary") and files:
-        start_dt = utils.get_now()
-        status_area = st.empty()
-        zip_buf = io.BytesIO()
-        
-        # Load Model
-        with st.spinner("Loading NLLB-3.3B Model to VRAM..."):
-            tok, mdl = trans_nllb.load_model("facebook/nllb-200-3.3B")
-            
-        with zipfile.ZipFile(zip_buf, "w") as z:
-            for idx, f in enumerate(files, 1):
-                raw_text = f.read().decode("utf-8", "ignore")
-                rows = utils.parse_srt(raw_text)
-                
-                out = trans_nllb.translate(rows, tok, mdl, status_area, f.name, idx, len(files))
-                
-                built_srt = utils.build_srt([[r[0], r[1], t] for r, t in zip(rows, out)])
-                z.writestr(f"KR_{f.name}", built_srt)
-                
-        end_dt = utils.get_now()
-        status_area.empty()
-        st.success(f"🎉 All Completed in {utils.format_duration(start_dt, end_dt)}")
-        st.download_button("📥 Download Result ZIP", zip_buf.getvalue(), "NLLB_Translated.zip")
+        submit_job("nllb", files, options={"decode": nllb_decode})
 
 # [TAB 2] Gemini
 with tabs[1]:
     st.info("💡 **Gemini 2.0 Flash**: Context-aware translation (±3 lines). Tuned for natural Korean subtitles.")
     polish_mode = st.toggle("🛠️ Polishing Mode (Input is already Korean)", value=False)
     files = st.file_uploader("Upload SRT Files", type=["srt"], accept_multiple_files=True, key="gemini_up")
+    gemini_opts = estimate_panel("gemini", files, polish_mode, "gemini")
     
     if st.button("Start Gemini Translation", type="primary") and files:
         if not GEMINI_API_KEY:
             st.error("⚠️ Please enter Gemini API Key in the sidebar.")
         else:
-            start_dt = utils.get_now()
-            status_area = st.empty()
-            zip_buf = io.BytesIO()
-            model_name = "gemini-2.0-flash"
-            
-            with zipfile.ZipFile(zip_buf, "w") as z:
-                for idx, f in enumerate(files, 1):
-                    raw_text = f.read().decode("utf-8", "ignore")
-                    rows = utils.parse_srt(raw_text)
-                    
-                    out = asyncio.run(trans_gemini.translate_async(
-                        rows, GEMINI_API_KEY, model_name, status_area, f.name, polish_mode, idx, len(files)
-                    ))
-                    
-                    built_srt = utils.build_srt([[r[0], r[1], t] for r, t in zip(rows, out)])
-                    z.writestr(f"KR_{f.name}", built_srt)
-
-            end_dt = utils.get_now()
-            status_area.empty()
-            st.success(f"🎉 All Completed in {utils.format_duration(start_dt, end_dt)}")
-            st.download_button("📥 Download Result ZIP", zip_buf.getvalue(), "Gemini_Translated.zip")
+            submit_job("gemini", files, GEMINI_API_KEY, polish_mode, gemini_opts)
 
 # [TAB 3] DeepL
 with tabs[2]:
@@ -213,54 +243,79 @@ with tabs[2]:
         if not DEEPL_API_KEY:
             st.error("⚠️ Please enter DeepL API Key in the sidebar.")
         else:
-            start_dt = utils.get_now()
-            status_area = st.empty()
-            zip_buf = io.BytesIO()
-            
-            with zipfile.ZipFile(zip_buf, "w") as z:
-                for idx, f in enumerate(files, 1):
-                    raw_text = f.read().decode("utf-8", "ignore")
-                    rows = utils.parse_srt(raw_text)
-                    
-                    out = asyncio.run(trans_deepl.translate_async(
-                        rows, DEEPL_API_KEY, status_area, f.name, idx, len(files)
-                    ))
-                    
-                    built_srt = utils.build_srt([[r[0], r[1], t] for r, t in zip(rows, out)])
-                    z.writestr(f"KR_{f.name}", built_srt)
-            
-            end_dt = utils.get_now()
-            status_area.empty()
-            st.success(f"🎉 All Completed in {utils.format_duration(start_dt, end_dt)}")
-            st.download_button("📥 Download Result ZIP", zip_buf.getvalue(), "DeepL_Translated.zip")
+            submit_job("deepl", files, DEEPL_API_KEY)
 
 # [TAB 4] Claude
 with tabs[3]:
     st.info("💡 **Claude 3.5 Sonnet**: High nuance understanding.")
     polish_mode_c = st.toggle("🛠️ Polishing Mode", value=False, key="c_polish")
     files = st.file_uploader("Upload SRT Files", type=["srt"], accept_multiple_files=True, key="claude_up")
+    claude_opts = estimate_panel("claude", files, polish_mode_c, "claude")
     
     if st.button("Start Claude Translation", type="primary") and files:
         if not CLAUDE_API_KEY:
             st.error("⚠️ Please enter Claude API Key in the sidebar.")
         else:
-            start_dt = utils.get_now()
-            status_area = st.empty()
-            zip_buf = io.BytesIO()
-            
-            with zipfile.ZipFile(zip_buf, "w") as z:
-                for idx, f in enumerate(files, 1):
-                    raw_text = f.read().decode("utf-8", "ignore")
-                    rows = utils.parse_srt(raw_text)
-                    
-                    out = asyncio.run(trans_claude.translate_async(
-                        rows, CLAUDE_API_KEY, status_area, f.name, polish_mode_c, idx, len(files)
-                    ))
-                    
-                    built_srt = utils.build_srt([[r[0], r[1], t] for r, t in zip(rows, out)])
-                    z.writestr(f"KR_{f.name}", built_srt)
-            
-            end_dt = utils.get_now()
-            status_area.empty()
-            st.success(f"🎉 All Completed in {utils.format_duration(start_dt, end_dt)}")
-            st.download_button("📥 Download Result ZIP", zip_buf.getvalue(), "Claude_Translated.zip")
\ No newline at end of file
+            submit_job("claude", files, CLAUDE_API_KEY, polish_mode_c, claude_opts)
+
+# [TAB 5] NLLB → LLM Polish Pipeline
+with tabs[4]:
+    st.info("💡 **Two-stage Pipeline**: NLLB drafts on the local GPU while Gemini/Claude polish finished batches at the same time.")
+    col1, col2 = st.columns(2)
+    with col1:
+        polish_engine = st.radio("Polish Engine", ["Gemini", "Claude"], horizontal=True, key="pipe_engine")
+    with col2:
+        only_suspicious = st.toggle("🔍 Polish only suspicious drafts", value=True, key="pipe_suspicious",
+                                    help="비었거나 한글이 아니거나, 원문 그대로이거나, 길이/반복이 이상한 초안만 LLM으로 보냅니다.")
+    files = st.file_uploader("Upload SRT Files", type=["srt"], accept_multiple_files=True, key="pipe_up")
+    
+    if st.button("Start Pipeline Translation", type="primary") and files:
+        api_key = GEMINI_API_KEY if polish_engine == "Gemini" else CLAUDE_API_KEY
+        if not api_key:
+            st.error(f"⚠️ Please enter {polish_engine} API Key in the sidebar.")
+        else:
+            submit_job(f"nllb_{polish_engine.lower()}", files, api_key, options={"only_suspicious": only_suspicious})
+
+# ======================
+# JOB QUEUE (polling)
+# ======================
+STATUS_ICON = {"queued": "⏳", "running": "⚙️", "done": "🎉", "failed": "❌"}
+
+@st.fragment(run_every=2)
+def job_panel():
+    job_list = jobs.list_jobs(SESSION_ID)
+    if not job_list: return
+    st.markdown("---")
+    st.subheader("📋 Jobs")
+    for job in job_list:
+        mode = " · Polish" if job["polish"] else ""
+        with st.container(border=True):
+            st.markdown(f"{STATUS_ICON[job['status']]} **{job['engine'].upper().replace('_', ' → ')}{mode}** `{job['id']}` — {job['names']}")
+            if job["status"] == "queued":
+                st.caption(f"Waiting in queue ({job['ahead']} ahead)")
+            elif job["status"] == "running":
+                if job["progress"]:
+                    st.markdown(job["progress"], unsafe_allow_html=True)
+            elif job["status"] == "failed":
+                st.error(f"⚠️ {job['error']}")
+            else:
+                st.success(f"🎉 All Completed in {jobs.job_duration(job)}")
+                report = json.loads(job["report"] or "{}")
+                if report.get("cues") and report["units"] != report["cues"]:
+                    st.caption(f"🧩 Sentence Merge: {report['cues']:,} cues → {report['units']:,} units "
+                               f"({1 - report['units'] / report['cues']:.0%} 감소)")
+                if report.get("checked"):
+                    reasons = ", ".join(f"{k} {v}" for k, v in report["reasons"].items())
+                    st.caption(f"🧪 Validator: {report['failed']:,}/{report['checked']:,} failed"
+                               f"{f' ({reasons})' if reasons else ''} → {report['remaining']:,} left after retry")
+                if report.get("drafted"):
+                    st.caption(f"🔗 Pipeline: {report['drafted']:,} drafts → {report['sent']:,} sent to polish "
+                               f"→ {report['polished']:,} changed")
+                st.download_button("📥 Download Result ZIP", jobs.get_result(job["id"]),
+                                   jobs.ENGINES[job["engine"]][1], key=f"dl_{job['id']}")
+            if job["status"] in ("done", "failed"):
+                if st.button("Dismiss", key=f"rm_{job['id']}"):
+                    jobs.dismiss(SESSION_ID, job["id"])
+                    st.rerun(scope="fragment")
+
+job_panel()
@@ -0,0 +1,146 @@
+import queue
+import asyncio
+import threading
+
+import aiohttp
+import utils
+import trans_nllb
+import trans_gemini
+import trans_claude
+import validator
+
+# ======================
+# CONFIG
+# ======================
+QUEUE_SIZE = 8          # NLLB → LLM 사이 배치 버퍼 (가득 차면 NLLB가 대기: backpressure)
+_DONE = None            # 1단계 종료 신호
+
+POLISH_ENGINES = {
+    # engine: (기본 동시성, 표시 이름)
+    "gemini": (trans_gemini.GEMINI_CONCURRENCY, "Gemini"),
+    "claude": (trans_claude.CLAUDE_CONCURRENCY, "Claude"),
+}
+
+# ======================
+# QUALITY HEURISTIC
+# ======================
+def needs_polish(src, out, idxs, names=None):
+    """idxs 중 교정이 필요한 초안 인덱스: 작업 검증(validator)과 같은 기준
+    (비었음/원문 그대로/한글 아님/길이 이상/반복 폭주, 숫자·추임새·이름은 제외)"""
+    _, failures, _ = validator.validate(src, out, only=set(idxs), names=names)
+    return [i for i in idxs if i in failures]
+
+# ======================
+# PIPELINE
+# ======================
+def _render_status(status, engine, total, drafted, polished, checked, file_info, file_idx, total_files, src, res):
+    name = POLISH_ENGINES[engine][1]
+    status.markdown(f"""
+    <div style="background:#1e1e1e;padding:15px;border-radius:12px;border:1px solid #b388ff; box-shadow: 0 4px 6px rgba(0,0,0,0.3);">
+    <div style="display:flex;align-items:center;gap:10px;margin-bottom:10px;">
+        <h4 style="margin:0;color:#b388ff;">🔗 NLLB → {name} Polish</h4>
+        <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">Draft {drafted}/{total}</span>
+        <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">Polish {polished}/{checked}</span>
+        <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">File {file_idx}/{total_files}</span>
+    </div>
+    <div style="font-size:0.9em;color:#aaa;margin-bottom:5px;">📂 {file_info}</div>
+    <div style="background:#2d2d2d;padding:10px;border-radius:8px;margin-bottom:8px;">
+        <span style="color:#888;font-size:0.85em;">Original</span><br>
+        <span style="color:#eee;">{utils.clean_text(src)}</span>
+    </div>
+    <div style="background:#263238;padding:10px;border-radius:8px;border-left:4px solid #b388ff;">
+        <span style="color:#b388ff;font-size:0.85em;">Polished</span><br>
+        <span style="color:#fff;font-weight:bold;">{utils.clean_text(res)}</span>
+    </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+class _Silent:
+    """1단계(NLLB) 진행 표시는 파이프라인 카드가 대신하므로 무시"""
+    def markdown(self, *args, **kwargs): pass
+
+async def _polish_stage(session, q, engine, api_key, src, out, only_suspicious, concurrency, counts, render):
+    """큐에서 NLLB 배치 결과를 받아 (필요한 줄만) LLM 교정"""
+    names = validator.proper_nouns(src)
+    while True:
+        finished = await asyncio.to_thread(q.get)
+        if finished is _DONE: return
+
+        for idx, res in finished:
+            out[idx] = res
+        counts["drafted"] += len(finished)
+        targets = [idx for idx, _ in finished]
+        if only_suspicious: targets = needs_polish(src, out, targets, names)
+        counts["sent"] += len(targets)
+
+        for j in range(0, len(targets), concurrency):
+            chunk = targets[j:j + concurrency]
+            before = [out[i] for i in chunk]
+            if engine == "gemini":
+                tasks = [trans_gemini.fetch_gemini(session, api_key, trans_gemini.GEMINI_MODEL,
+                                                   trans_gemini.build_prompt(out, i, True, source=src[i]), i, out)
+                         for i in chunk]
+            else:
+                tasks = [trans_claude.fetch_claude_retry(session, api_key,
+                                                         trans_claude.build_payload(out, i, True, source=src[i]), i, out)
+                         for i in chunk]
+            await asyncio.gather(*tasks)
+            counts["polished"] += sum(1 for i, b in zip(chunk, before) if out[i] != b)
+
+        render(finished[-1][0])
+
+async def translate_async(rows, tok, mdl, engine, api_key, status, file_info, file_idx, total_files,
+                          only_suspicious=True, pool=None, concurrency=None, report=None, only=None):
+    """NLLB 초안 → LLM 교정을 동시에 실행.
+    NLLB 배치가 끝날 때마다 완료된 행이 bounded queue를 통해 교정 단계로 흘러감.
+    only_suspicious=True면 needs_polish()에 걸린 초안만 LLM으로 보냄.
+    only(인덱스 집합)가 주어지면 그 줄만 beam으로 다시 초안 + 무조건 교정 (검증 실패 재시도)"""
+    src = [r[2] for r in rows]
+    decode = trans_nllb.DECODE_MODE
+    if only is not None:
+        decode, only_suspicious = trans_nllb.RETRY_DECODE, False
+    out = src[:]  # 교정 단계 문맥용: 아직 초안이 없는 줄은 원문 그대로
+    total = sum(1 for i, t in enumerate(src) if utils.clean_text(t) and (only is None or i in only))
+    concurrency = concurrency or POLISH_ENGINES[engine][0]
+    q = queue.Queue(maxsize=QUEUE_SIZE)
+    stage1_error = []
+    aborted = threading.Event()
+
+    def put(item):
+        # 교정 단계가 실패하면 큐가 비워지지 않으므로 NLLB도 중단
+        while not aborted.is_set():
+            try:
+                q.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+        raise RuntimeError("pipeline aborted")
+
+    def stage1():
+        try:
+            trans_nllb.translate(rows, tok, mdl, _Silent(), file_info, file_idx, total_files,
+                                 pool=pool, on_rows=put, decode=decode, only=only)
+        except Exception as e:
+            stage1_error.append(e)
+        try:
+            put(_DONE)
+        except RuntimeError:
+            pass
+
+    threading.Thread(target=stage1, name="pipeline-nllb", daemon=True).start()
+
+    counts = {"drafted": 0, "sent": 0, "polished": 0}
+    connector = aiohttp.TCPConnector(limit_per_host=concurrency)
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await _polish_stage(session, q, engine, api_key, src, out, only_suspicious, concurrency, counts,
+                                lambda last: _render_status(status, engine, total, counts["drafted"], counts["polished"],
+                                                            counts["sent"], file_info, file_idx, total_files, src[last], out[last]))
+    finally:
+        aborted.set()
+
+    if stage1_error: raise stage1_error[0]
+    if report is not None and only is None:  # 재시도는 초안/교정 통계에서 제외
+        for k, v in counts.items():
+            report[k] = report.get(k, 0) + v
+    return out
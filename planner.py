@@ -0,0 +1,135 @@
+import math
+
+import utils
+import jobs
+import trans_gemini
+import trans_claude
+
+# ======================
+# CONFIG
+# ======================
+# USD / 1M tokens (input, output)
+PRICING = {
+    "gemini": (0.10, 0.40),
+    "claude": (3.00, 15.00),
+}
+# 아직 실측값이 없을 때 쓰는 요청당 지연시간 (초)
+DEFAULT_LATENCY = {"gemini": 1.5, "claude": 3.0}
+# 출력 토큰 ≈ 원문 토큰 × 비율 (한국어 출력이 영어 원문보다 토큰이 조금 많음)
+OUTPUT_RATIO = 1.3
+OUTPUT_OVERHEAD = 4  # 따옴표/줄바꿈 등 군더더기
+REQUEST_OVERHEAD = 8  # 메시지 포맷/역할 토큰
+
+# 출력 토큰 생성 속도 (토큰/초): 여러 줄 요청은 한 줄 요청보다 이만큼 더 오래 걸림
+DECODE_TPS = {"gemini": 150, "claude": 50}
+
+CONCURRENCY_CHOICES = [1, 2, 3, 5, 8, 10, 15, 20]
+BATCH_CHOICES = [1, 5, 10, 20, 30]  # 요청당 자막 줄 수 (출력 상한 1024 토큰 안쪽)
+
+ENGINES = {
+    # engine: (context 기본값, concurrency 기본값, 청크 간 딜레이, 요청당 줄 수 기본값)
+    "gemini": (trans_gemini.GEMINI_CONTEXT, trans_gemini.GEMINI_CONCURRENCY, trans_gemini.GEMINI_CHUNK_DELAY,
+               trans_gemini.GEMINI_BATCH),
+    "claude": (trans_claude.CLAUDE_CONTEXT, trans_claude.CLAUDE_CONCURRENCY, 0.0, trans_claude.CLAUDE_BATCH),
+}
+
+# ======================
+# TOKENS
+# ======================
+def approx_tokens(text):
+    """로컬 토크나이저 근사: ASCII는 약 4글자당 1토큰, 한글/CJK 등은 글자당 약 1토큰"""
+    if not text: return 0
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars))
+
+def build_requests(engine, units, polish_ko, context, batch=1):
+    """엔진이 실제로 보낼 요청을 만들어 (입력 텍스트, [원문, ...]) 목록으로 반환 (전송하지 않음)"""
+    texts = [u[2] for u in units]
+    targets = utils.select_targets(texts, polish_ko)
+    groups = [targets[p:p + batch] for p in range(0, len(targets), batch)]
+    reqs = []
+    for g in groups:
+        if engine == "gemini":
+            prompt = (trans_gemini.build_prompt(texts, g[0], polish_ko, context) if len(g) == 1
+                      else trans_gemini.build_batch_prompt(texts, g, polish_ko, context))
+        elif engine == "claude":
+            payload = (trans_claude.build_payload(texts, g[0], polish_ko, context) if len(g) == 1
+                       else trans_claude.build_batch_payload(texts, g, polish_ko, context))
+            prompt = "\n".join(m["content"] for m in payload["messages"])
+        else:
+            raise ValueError(f"Unknown engine: {engine}")
+        reqs.append((prompt, [texts[i] for i in g]))
+    return reqs
+
+# ======================
+# PLAN
+# ======================
+def _count(engine, files, polish_ko, merge, context, batch=1):
+    """파일별 (요청 수, 입력 토큰, 출력 토큰, 번역 줄 수) + 전체 큐/단위 수"""
+    per_file, stats = [], [0, 0]
+    for _, raw_text in files:
+        rows = utils.parse_srt(raw_text)
+        units, _ = jobs.prepare_units(rows, merge, stats)
+        reqs = build_requests(engine, units, polish_ko, context, batch)
+        in_tok = sum(approx_tokens(p) + REQUEST_OVERHEAD for p, _ in reqs)
+        out_tok = sum(math.ceil(approx_tokens(src) * OUTPUT_RATIO) + OUTPUT_OVERHEAD for _, srcs in reqs for src in srcs)
+        per_file.append((len(reqs), in_tok, out_tok, sum(len(srcs) for _, srcs in reqs)))
+    return per_file, stats
+
+def _project(engine, per_file, concurrency):
+    """요청/토큰 수로부터 비용과 소요 시간 추정 (파일은 순차, 파일 안에서는 concurrency개씩 청크).
+    실측 지연시간은 한 줄 요청 기준 → 여러 줄 요청은 늘어난 출력 토큰만큼 생성 시간 추가"""
+    price_in, price_out = PRICING[engine]
+    delay = ENGINES[engine][2]
+    latency = utils.get_latency(engine, DEFAULT_LATENCY[engine])
+    requests = sum(n for n, _, _, _ in per_file)
+    in_tok = sum(i for _, i, _, _ in per_file)
+    out_tok = sum(o for _, _, o, _ in per_file)
+    seconds = 0.0
+    for n, _, o, cues in per_file:
+        if not n: continue
+        extra = max(0.0, o / n - o / cues) / DECODE_TPS[engine]
+        seconds += math.ceil(n / concurrency) * (latency + delay + extra)
+    return {
+        "requests": requests,
+        "input_tokens": in_tok,
+        "output_tokens": out_tok,
+        "cost": in_tok * price_in / 1e6 + out_tok * price_out / 1e6,
+        "seconds": seconds,
+        "latency": latency,
+    }
+
+def plan(engine, files, polish_ko=False, merge=True, context=None, concurrency=None, batch=None):
+    """업로드 파일에 대한 사전 견적 (dry-run).
+    files: [(파일명, 텍스트), ...]. 동일 작업이 이미 큐에 있으면 비용 0으로 처리"""
+    default_ctx, default_conc, _, default_batch = ENGINES[engine]
+    context = default_ctx if context is None else context
+    concurrency = concurrency or default_conc
+    batch = batch or default_batch
+
+    per_file, (cues, units) = _count(engine, files, polish_ko, merge, context, batch)
+    result = _project(engine, per_file, concurrency)
+    result.update(cues=cues, units=units, context=context, concurrency=concurrency, batch=batch, dedup_job=None)
+
+    options = {"context": context, "concurrency": concurrency, "batch": batch}
+    existing = jobs.find_job(jobs.content_hash(engine, polish_ko, merge, files, options))
+    if existing:
+        result.update(dedup_job=existing, requests=0, input_tokens=0, output_tokens=0, cost=0.0, seconds=0.0)
+    return result
+
+def suggest(engine, files, time_budget, polish_ko=False, merge=True, context=None):
+    """time_budget(초) 안에 끝나는 설정 중 비용이 가장 낮은 요청당 줄 수(batch)/concurrency 조합.
+    비용은 지시문/문맥을 몇 줄이 나눠 쓰는지(batch)로 정해지고, concurrency는 시간에만 영향.
+    비용이 같으면 Rate Limit에 덜 걸리는 낮은 concurrency, 그다음 작은 batch 우선.
+    context는 사용자가 고른 값 고정. 반환: (최선 또는 None, 전체 후보)"""
+    context = ENGINES[engine][0] if context is None else context
+    candidates = []
+    for batch in BATCH_CHOICES:
+        per_file, _ = _count(engine, files, polish_ko, merge, context, batch)
+        for concurrency in CONCURRENCY_CHOICES:
+            p = _project(engine, per_file, concurrency)
+            p.update(context=context, concurrency=concurrency, batch=batch)
+            candidates.append(p)
+    feasible = [p for p in candidates if p["seconds"] <= time_budget]
+    best = min(feasible, key=lambda p: (round(p["cost"], 6), p["concurrency"], p["batch"]), default=None)
+    return best, candidates
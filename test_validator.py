@@ -0,0 +1,39 @@
+import pytest
+
+import validator
+
+# 짧아도 번역해야 하는 줄: 원문 그대로(앵무새) 나오면 실패
+PARROTS = ["What?", "Sorry.", "Help!", "Wait.", "大丈夫?", "ありがとう", "Что?"]
+# 번역하지 않아도 정상인 줄
+NON_LEXICAL = ["♪ la la ♪", "2019", "♪ ♪", "Oh!"]
+
+@pytest.mark.parametrize("src", PARROTS)
+def test_short_parrot_is_untranslated(src):
+    _, failures, _ = validator.validate([src], [src])
+    assert failures == {0: "untranslated"}
+
+@pytest.mark.parametrize("src", NON_LEXICAL)
+def test_non_lexical_kept_as_is(src):
+    _, failures, _ = validator.validate([src], [src])
+    assert failures == {}
+
+def test_name_kept_only_when_it_is_a_name():
+    texts = ["I saw John yesterday.", "John!"]
+    _, failures, _ = validator.validate(texts, ["어제 John을 봤어.", "John!"])
+    assert failures == {}
+    # 파일 안에서 이름으로 쓰인 적 없는 한 단어는 그대로 두면 실패
+    _, failures, _ = validator.validate(["Wait."], ["Wait."])
+    assert failures == {0: "untranslated"}
+
+def test_translated_short_lines_pass():
+    _, failures, _ = validator.validate(PARROTS, ["뭐?", "미안.", "살려줘!", "잠깐.", "괜찮아?", "고마워", "뭐?"])
+    assert failures == {}
+
+def test_wrong_script():
+    _, failures, _ = validator.validate(["Where were you last night?"], ["Où étais-tu hier soir ?"])
+    assert failures == {0: "wrong_script"}
+
+def test_repeated_only_when_source_does_not_repeat():
+    _, failures, _ = validator.validate(["Run away now", "Run run run away"],
+                                        ["달려 달려 달려 달려", "달려 달려 달려 도망쳐"])
+    assert failures == {0: "repeated"}
@@ -1,13 +1,13 @@
 import aiohttp
 import asyncio
-import re
+import time
 import utils
 
 CLAUDE_CONTEXT = 4
 CLAUDE_MODEL = "claude-sonnet-4-20250514"
-
-def is_korean(text):
-    return bool(re.search(r"[가-힣]", text))
+CLAUDE_CONCURRENCY = 5
+CLAUDE_MAX_TOKENS = 1024
+CLAUDE_BATCH = 1  # 요청 하나에 보내는 자막 줄 수 (>1이면 지시문/문맥을 여러 줄이 공유 → 입력 토큰 절약)
 
 async def fetch_claude_retry(session, api_key, payload, idx, out_list):
     url = "https://api.anthropic.com/v1/messages"
@@ -15,9 +15,11 @@ async def fetch_claude_retry(session, api_key, payload, idx, out_list):
     
     for attempt in range(3):
         try:
+            t0 = time.perf_counter()
             async with session.post(url, headers=headers, json=payload, timeout=60) as r:
                 if r.status == 200:
                     data = await r.json()
+                    utils.record_latency("claude", time.perf_counter() - t0)
                     text = data["content"][0]["text"].strip()
                     # 앵무새 방지: 혹시라도 원문이 그대로 나오면(간단한 체크) 재시도할 수도 있음. 
                     # 여기선 일단 결과 저장.
@@ -29,31 +31,36 @@ async def fetch_claude_retry(session, api_key, payload, idx, out_list):
             await asyncio.sleep(1)
     return None
 
-async def translate_async(rows, api_key, status, file_info, polish_ko, file_idx, total_files):
-    texts = [r[2] for r in rows]
-    out = texts[:]
-    targets = []
+def build_payload(texts, i, polish_ko, context=CLAUDE_CONTEXT, source=None):
+    # source가 주어지면 texts[i]는 source의 기계 번역 초안 → 원문과 대조해 교정
+    prev_ctx = "\n".join(texts[max(0, i - context):i])
+    next_ctx = "\n".join(texts[i + 1:i + 1 + context])
+    
+    if source is not None:
+        # 초안 교정 모드: 원문 + 초안을 함께 보내 오역까지 바로잡기
+        user_prompt = f"""[System]
+You are a professional Korean subtitle editor. The Korean draft below is a machine translation of the source text.
+Compare it with the source, fix mistranslations and omissions, and polish it into natural Korean movie subtitles.
+
+[Context Info]
+{prev_ctx}
 
-    for i, t in enumerate(texts):
-        cleaned = utils.clean_text(t)
-        if not cleaned: continue
-        if polish_ko:
-            if is_korean(cleaned): targets.append(i)
-        else:
-            if not is_korean(cleaned): targets.append(i)
+[Source Text]
+{source}
 
-    connector = aiohttp.TCPConnector(limit_per_host=5)
-    async with aiohttp.ClientSession(connector=connector) as session:
-        for j in range(0, len(targets), 5):
-            chunk = targets[j:j + 5]
-            tasks = []
-            for i in chunk:
-                prev_ctx = "\n".join(texts[max(0, i - CLAUDE_CONTEXT):i])
-                next_ctx = "\n".join(texts[i + 1:i + 1 + CLAUDE_CONTEXT])
-                
-                if polish_ko:
-                    # 교정 모드: 이미 한국어이므로 자연스럽게 다듬기
-                    user_prompt = f"""[System]
+[Korean Draft]
+{texts[i]}
+
+[Context Info]
+{next_ctx}
+
+[Output]
+Provide ONLY the polished Korean text. Do not add explanations."""
+        prefill = "다듬은 결과:"
+
+    elif polish_ko:
+        # 교정 모드: 이미 한국어이므로 자연스럽게 다듬기
+        user_prompt = f"""[System]
 You are a professional Korean subtitle editor. The following text is already in Korean (or broken Korean).
 Polishing it into natural, high-quality Korean movie subtitles.
 Maintain the original meaning but improve fluency, tone, and spacing.
@@ -63,12 +70,12 @@ Maintain the original meaning but improve fluency, tone, and spacing.
 
 [Output]
 Provide ONLY the polished Korean text. Do not add explanations."""
-                    # Pre-fill (다듬은 결과:)
-                    prefill = "다듬은 결과:"
-                
-                else:
-                    # 번역 모드: 앵무새 방지 강화
-                    user_prompt = f"""[Role]
+        # Pre-fill (다듬은 결과:)
+        prefill = "다듬은 결과:"
+    
+    else:
+        # 번역 모드: 앵무새 방지 강화
+        user_prompt = f"""[Role]
 You are a professional subtitle translator. Translate the target text into 'Korean'.
 
 [Context Info]
@@ -85,30 +92,99 @@ You are a professional subtitle translator. Translate the target text into 'Kore
 2. DO NOT repeat the original text.
 3. DO NOT add notes or explanations.
 4. Use natural spoken Korean (subtitles)."""
-                    # Pre-fill (한국어 자막:) -> 강제로 한국어를 뱉게 유도
-                    prefill = "한국어 자막:"
-
-                payload = {
-                    "model": CLAUDE_MODEL,
-                    "max_tokens": 1024,
-                    "messages": [
-                        {"role": "user", "content": user_prompt},
-                        {"role": "assistant", "content": prefill} # Prefill Added
-                    ],
-                    "temperature": 0.1
-                }
-                
-                # Retry Logic
-                tasks.append(fetch_claude_retry(session, api_key, payload, i, out))
+        # Pre-fill (한국어 자막:) -> 강제로 한국어를 뱉게 유도
+        prefill = "한국어 자막:"
+
+    payload = {
+        "model": CLAUDE_MODEL,
+        "max_tokens": CLAUDE_MAX_TOKENS,
+        "messages": [
+            {"role": "user", "content": user_prompt},
+            {"role": "assistant", "content": prefill} # Prefill Added
+        ],
+        "temperature": 0.1
+    }
+    return payload
+
+def build_batch_payload(texts, idxs, polish_ko, context=CLAUDE_CONTEXT):
+    """여러 줄(idxs)을 번호를 붙여 한 요청으로. 문맥은 첫 줄 앞/마지막 줄 뒤만"""
+    prev_ctx = "\n".join(texts[max(0, idxs[0] - context):idxs[0]])
+    next_ctx = "\n".join(texts[idxs[-1] + 1:idxs[-1] + 1 + context])
+    if polish_ko:
+        task = ("The numbered lines are already in Korean (or broken Korean). Polish each into natural, "
+                "high-quality Korean movie subtitles, keeping the original meaning.")
+        prefill = "다듬은 결과:"
+    else:
+        task = "Translate each numbered line into natural spoken Korean subtitles."
+        prefill = "한국어 자막:"
+
+    user_prompt = f"""[Role]
+You are a professional subtitle translator. {task}
+
+[Context Info]
+{prev_ctx}
+
+[Target Lines]
+{utils.number_lines([texts[i] for i in idxs])}
+
+[Context Info]
+{next_ctx}
+
+[Constraints]
+1. Output exactly {len(idxs)} lines, each starting with the same [number] as its target line.
+2. Do not merge or split lines.
+3. DO NOT repeat the original text.
+4. DO NOT add notes or explanations."""
+
+    return {
+        "model": CLAUDE_MODEL,
+        "max_tokens": CLAUDE_MAX_TOKENS,
+        "messages": [
+            {"role": "user", "content": user_prompt},
+            {"role": "assistant", "content": prefill}
+        ],
+        "temperature": 0.1
+    }
+
+async def fetch_claude_batch(session, api_key, payload, idxs, out_list):
+    buf = [None]
+    await fetch_claude_retry(session, api_key, payload, 0, buf)
+    # 번호가 빠진 줄은 원문 그대로 남음 → 검증기가 잡아 재번역
+    for i, text in zip(idxs, utils.parse_numbered(buf[0], len(idxs))):
+        if text: out_list[i] = text
+
+async def translate_async(rows, api_key, status, file_info, polish_ko, file_idx, total_files,
+                          context=CLAUDE_CONTEXT, concurrency=CLAUDE_CONCURRENCY, only=None, batch=CLAUDE_BATCH):
+    texts = [r[2] for r in rows]
+    out = texts[:]
+    targets = utils.select_targets(texts, polish_ko)
+    if only is not None: targets = [i for i in targets if i in only]  # 검증 실패 줄만 재번역
+    groups = [targets[p:p + batch] for p in range(0, len(targets), batch)]
+
+    connector = aiohttp.TCPConnector(limit_per_host=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        done = 0
+        for j in range(0, len(groups), concurrency):
+            chunk = groups[j:j + concurrency]
+            tasks = []
+            for g in chunk:
+                if len(g) == 1:
+                    payload = build_payload(texts, g[0], polish_ko, context)
+                    # Retry Logic
+                    tasks.append(fetch_claude_retry(session, api_key, payload, g[0], out))
+                else:
+                    payload = build_batch_payload(texts, g, polish_ko, context)
+                    tasks.append(fetch_claude_batch(session, api_key, payload, g, out))
 
             await asyncio.gather(*tasks)
+            done += sum(map(len, chunk))
             if chunk:
-                last = chunk[-1]
+                last = chunk[-1][-1]
                 status.markdown(f"""
                 <div style="background:#1e1e1e;padding:15px;border-radius:12px;border:1px solid #ffb703; box-shadow: 0 4px 6px rgba(0,0,0,0.3);">
                 <div style="display:flex;align-items:center;gap:10px;margin-bottom:10px;">
                     <h4 style="margin:0;color:#ffb703;">✨ Claude Sonnet 3.5</h4>
-                    <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">{min(j+len(chunk), len(targets))}/{len(targets)}</span>
+                    <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">{done}/{len(targets)}</span>
                     <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">File {file_idx}/{total_files}</span>
                 </div>
                 <div style="font-size:0.9em;color:#aaa;margin-bottom:5px;">📂 {file_info}</div>
@@ -46,12 +46,12 @@ async def fetch_deepl_batch(session, api_key, text_chunk, start_idx, out_list, c
             pass
     return 0
 
-async def translate_async(rows, api_key, status, file_info, file_idx, total_files):
+async def translate_async(rows, api_key, status, file_info, file_idx, total_files, only=None):
     texts = [r[2] for r in rows]
     out = texts[:]
     
-    # 번역할 대상 인덱스 추출
-    targets = [i for i, t in enumerate(texts) if utils.clean_text(t)]
+    # 번역할 대상 인덱스 추출 (only가 주어지면 해당 인덱스만 재번역)
+    targets = [i for i, t in enumerate(texts) if utils.clean_text(t) and (only is None or i in only)]
     if not targets: return out
     
     connector = aiohttp.TCPConnector(limit_per_host=2) # 배치니까 동시성 낮아도 됨
@@ -62,8 +62,6 @@ async def translate_async(rows, api_key, status, file_info, file_idx, total_file
             chunk_indices = targets[i : i + batch_size]
             chunk_texts = [texts[idx] for idx in chunk_indices]
             
-            await fetch_deepl_batch(session, api_key, chunk_texts, 0, [], {}) # Dummy call definition above needs adjustment
-            
             # 실제 구현: fetch_deepl_batch 내장 로직을 여기서 풀어씀 (리스트 지원 활용)
             url = "https://api-free.deepl.com/v2/translate"
             success = False
@@ -104,19 +102,13 @@ async def translate_async(rows, api_key, status, file_info, file_idx, total_file
             status.markdown(f"""
             <div style="background:#1e1e1e;padding:15px;border-radius:12px;border:1px solid #ff9a9e; box-shadow: 0 4px 6px rgba(0,0,0,0.3);">
             <div style="display:flex;align-items:center;gap:10px;margin-bottom:10px;">
-<<<<<<< HEAD
                 <h4 style="margin:0;color:#ff9a9e;">🌐 DeepL Pro (Context Batch)</h4>
                 <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">{min(i+len(chunk_indices), len(targets))}/{len(targets)}</span>
-=======
-                <h4 style="margin:0;color:#ff9a9e;">🌐 DeepL Pro Translation</h4>
-                <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">{idx+1}/{len(targets)}</span>
->>>>>>> e6721c93e0b749e2300dad4d5b8c81518adc5100
                 <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">File {file_idx}/{total_files}</span>
             </div>
             <div style="font-size:0.9em;color:#aaa;margin-bottom:5px;">📂 {file_info}</div>
              <div style="background:#2d2d2d;padding:10px;border-radius:8px;margin-bottom:8px;">
                 <span style="color:#888;font-size:0.85em;">Original</span><br>
-<<<<<<< HEAD
                 <span style="color:#eee;">{utils.clean_text(chunk_texts[-1])}</span>
             </div>
             <div style="background:#263238;padding:10px;border-radius:8px;border-left:4px solid #ff9a9e;">
@@ -128,15 +120,4 @@ async def translate_async(rows, api_key, status, file_info, file_idx, total_file
             
             await asyncio.sleep(0.5) # 안전 딜레이
             
-=======
-                <span style="color:#eee;">{utils.clean_text(texts[i])}</span>
-            </div>
-            <div style="background:#263238;padding:10px;border-radius:8px;border-left:4px solid #ff9a9e;">
-                <span style="color:#ff9a9e;font-size:0.85em;">Translated</span><br>
-                <span style="color:#fff;font-weight:bold;">{utils.clean_text(out[i])}</span>
-            </div>
-            </div>
-            """, unsafe_allow_html=True)
-            await asyncio.sleep(0.1)  # 429 방지 안정화 딜레이 약간 증가
->>>>>>> e6721c93e0b749e2300dad4d5b8c81518adc5100
     return out
\ No newline at end of file
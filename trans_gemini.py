@@ -1,28 +1,115 @@
 import aiohttp
 import asyncio
 import re
+import time
 import utils
 
+GEMINI_MODEL = "gemini-2.0-flash"
 GEMINI_CONTEXT = 3
+GEMINI_CONCURRENCY = 10    # Gemini 2.0 Flash는 빠르므로 동시성 10까지 허용 (Rate Limit 주의)
+GEMINI_CHUNK_DELAY = 0.5   # Rate Limit 방지를 위한 안전 딜레이
+GEMINI_MAX_OUTPUT = 1024
+GEMINI_BATCH = 1           # 요청 하나에 보내는 자막 줄 수 (>1이면 지시문/문맥을 여러 줄이 공유 → 입력 토큰 절약)
+
+POLISH_INSTRUCTION = (
+    "이 문장은 이미 한국어입니다. 오타나 어색한 표현을 수정하여 완벽한 자막체로 다듬으십시오.\n"
+    "의미를 왜곡하지 말고, 자연스러운 구어체로 만드세요."
+)
+TRANSLATE_INSTRUCTION = (
+    "이것은 영상 자막 번역 작업입니다. 주어진 문장을 '완벽한 한국어'로 번역하세요.\n"
+    "- 직역투를 피하고, 상황에 맞는 자연스러운 구어체/대화체를 사용하세요.\n"
+    "- 인물 호칭, 고유명사는 한국어 표준 발음 표기를 따르십시오.\n"
+    "- 원문(영어/일본어 등)을 절대 포함하지 마십시오."
+)
+
+def build_prompt(texts, i, polish_ko, context=GEMINI_CONTEXT, source=None):
+    # source가 주어지면 texts[i]는 source의 기계 번역 초안 → 원문과 대조해 교정
+    prev_ctx = "\n".join(texts[max(0, i - context):i])
+    next_ctx = "\n".join(texts[i + 1:i + 1 + context])
+    source_block = ""
+
+    if source is not None:
+        instruction = (
+            "이 문장은 아래 원문을 기계 번역한 한국어 초안입니다. 원문과 대조하여 오역과 누락을 바로잡고,\n"
+            "자연스러운 구어체 자막으로 다듬으십시오. 원문(영어/일본어 등)을 포함하지 마십시오."
+        )
+        source_block = f"\nSource (original):\n{source}\n"
+    elif polish_ko:
+        instruction = POLISH_INSTRUCTION
+    else:
+        instruction = TRANSLATE_INSTRUCTION
+
+    return f"""[Role]
+You are Korea's top-tier subtitle translator. Translate the following text into natural, high-quality Korean subtitles.
 
-def is_korean(text: str) -> bool:
-    return bool(re.search(r"[가-힣]", text))
+[Context Info]
+User settings: Context window ±{context} lines.
+Use the context below to infer tone, gender, and situation.
 
-async def fetch_gemini(session, api_key, model_name, prompt, idx, out_list):
-    url = f"https://generativelanguage.googleapis.com/v1/models/{model_name}:generateContent?key={api_key}"
-    payload = {
+Previous:
+{prev_ctx if prev_ctx else "(Start)"}
+
+Target Sentence:
+{texts[i]}
+{source_block}
+Next:
+{next_ctx if next_ctx else "(End)"}
+
+[Command]
+{instruction}
+
+[Output]
+Provide ONLY the Korean translation."""
+
+def build_batch_prompt(texts, idxs, polish_ko, context=GEMINI_CONTEXT):
+    """여러 줄(idxs)을 번호를 붙여 한 요청으로. 문맥은 첫 줄 앞/마지막 줄 뒤만"""
+    prev_ctx = "\n".join(texts[max(0, idxs[0] - context):idxs[0]])
+    next_ctx = "\n".join(texts[idxs[-1] + 1:idxs[-1] + 1 + context])
+    instruction = POLISH_INSTRUCTION if polish_ko else TRANSLATE_INSTRUCTION
+
+    return f"""[Role]
+You are Korea's top-tier subtitle translator. Translate the following text into natural, high-quality Korean subtitles.
+
+[Context Info]
+User settings: Context window ±{context} lines.
+Use the context below to infer tone, gender, and situation.
+
+Previous:
+{prev_ctx if prev_ctx else "(Start)"}
+
+Target Sentences ({len(idxs)} lines):
+{utils.number_lines([texts[i] for i in idxs])}
+
+Next:
+{next_ctx if next_ctx else "(End)"}
+
+[Command]
+{instruction}
+- 각 줄을 따로 처리하고, 줄을 합치거나 나누지 마십시오.
+
+[Output]
+Provide ONLY the Korean lines, one per target line, each starting with the same [number]."""
+
+def build_payload(prompt):
+    return {
         "contents": [{"parts": [{"text": prompt}]}],
         "generationConfig": {
             "temperature": 0.1,  # 정밀도 최우선
             "topP": 0.9,
-            "maxOutputTokens": 1024
+            "maxOutputTokens": GEMINI_MAX_OUTPUT
         }
     }
+
+async def fetch_gemini(session, api_key, model_name, prompt, idx, out_list):
+    url = f"https://generativelanguage.googleapis.com/v1/models/{model_name}:generateContent?key={api_key}"
+    payload = build_payload(prompt)
     for attempt in range(3):
         try:
+            t0 = time.perf_counter()
             async with session.post(url, json=payload, timeout=90) as r:
                 if r.status == 200:
                     data = await r.json()
+                    utils.record_latency("gemini", time.perf_counter() - t0)
                     text = data["candidates"][0]["content"]["parts"][0]["text"].strip()
                     # 불필요한 마크다운 및 따옴표 제거
                     text = re.sub(r"```[a-z]*\n?|\n?```", "", text).strip()
@@ -36,75 +123,45 @@ async def fetch_gemini(session, api_key, model_name, prompt, idx, out_list):
             await asyncio.sleep(1)
             pass
 
-async def translate_async(rows, api_key, model_name, status, file_info, polish_ko, file_idx, total_files):
+async def fetch_gemini_batch(session, api_key, model_name, prompt, idxs, out_list):
+    buf = [None]
+    await fetch_gemini(session, api_key, model_name, prompt, 0, buf)
+    # 번호가 빠진 줄은 원문 그대로 남음 → 검증기가 잡아 재번역
+    for i, text in zip(idxs, utils.parse_numbered(buf[0], len(idxs))):
+        if text: out_list[i] = text
+
+async def translate_async(rows, api_key, model_name, status, file_info, polish_ko, file_idx, total_files,
+                          context=GEMINI_CONTEXT, concurrency=GEMINI_CONCURRENCY, only=None, batch=GEMINI_BATCH):
     texts = [r[2] for r in rows]
     out = texts[:]
-    targets = []
-
-    for i, t in enumerate(texts):
-        cleaned = utils.clean_text(t)
-        if not cleaned: continue
-        if polish_ko:
-            if is_korean(cleaned): targets.append(i)
-        else:
-            if not is_korean(cleaned): targets.append(i)
+    targets = utils.select_targets(texts, polish_ko)
+    if only is not None: targets = [i for i in targets if i in only]  # 검증 실패 줄만 재번역
 
     if not targets: return out
+    groups = [targets[p:p + batch] for p in range(0, len(targets), batch)]
 
-    # Gemini 2.0 Flash는 빠르므로 동시성 10까지 허용 (Rate Limit 주의)
-    connector = aiohttp.TCPConnector(limit_per_host=10)
+    connector = aiohttp.TCPConnector(limit_per_host=concurrency)
     async with aiohttp.ClientSession(connector=connector) as session:
-        for j in range(0, len(targets), 10):
-            chunk = targets[j:j + 10]
+        done = 0
+        for j in range(0, len(groups), concurrency):
+            chunk = groups[j:j + concurrency]
             tasks = []
-            for i in chunk:
-                prev_ctx = "\n".join(texts[max(0, i - GEMINI_CONTEXT):i])
-                next_ctx = "\n".join(texts[i + 1:i + 1 + GEMINI_CONTEXT])
-                
-                if polish_ko:
-                    instruction = (
-                        "이 문장은 이미 한국어입니다. 오타나 어색한 표현을 수정하여 완벽한 자막체로 다듬으십시오.\n"
-                        "의미를 왜곡하지 말고, 자연스러운 구어체로 만드세요."
-                    )
+            for g in chunk:
+                if len(g) == 1:
+                    prompt = build_prompt(texts, g[0], polish_ko, context)
+                    tasks.append(fetch_gemini(session, api_key, model_name, prompt, g[0], out))
                 else:
-                    instruction = (
-                        "이것은 영상 자막 번역 작업입니다. 주어진 문장을 '완벽한 한국어'로 번역하세요.\n"
-                        "- 직역투를 피하고, 상황에 맞는 자연스러운 구어체/대화체를 사용하세요.\n"
-                        "- 인물 호칭, 고유명사는 한국어 표준 발음 표기를 따르십시오.\n"
-                        "- 원문(영어/일본어 등)을 절대 포함하지 마십시오."
-                    )
-
-                prompt = f"""[Role]
-You are Korea's top-tier subtitle translator. Translate the following text into natural, high-quality Korean subtitles.
-
-[Context Info]
-User settings: Context window ±{GEMINI_CONTEXT} lines.
-Use the context below to infer tone, gender, and situation.
-
-Previous:
-{prev_ctx if prev_ctx else "(Start)"}
-
-Target Sentence:
-{texts[i]}
-
-Next:
-{next_ctx if next_ctx else "(End)"}
-
-[Command]
-{instruction}
-
-[Output]
-Provide ONLY the Korean translation."""
-
-                tasks.append(fetch_gemini(session, api_key, model_name, prompt, i, out))
+                    prompt = build_batch_prompt(texts, g, polish_ko, context)
+                    tasks.append(fetch_gemini_batch(session, api_key, model_name, prompt, g, out))
 
             await asyncio.gather(*tasks)
-            last = chunk[-1]
+            done += sum(map(len, chunk))
+            last = chunk[-1][-1]
             status.markdown(f"""
             <div style="background:#1e1e1e;padding:15px;border-radius:12px;border:1px solid #4facfe; box-shadow: 0 4px 6px rgba(0,0,0,0.3);">
             <div style="display:flex;align-items:center;gap:10px;margin-bottom:10px;">
                 <h4 style="margin:0;color:#4facfe;">✨ Gemini Flash Ultra</h4>
-                <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">{min(j+len(chunk), len(targets))}/{len(targets)}</span>
+                <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">{done}/{len(targets)}</span>
                 <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">File {file_idx}/{total_files}</span>
             </div>
             <div style="font-size:0.9em;color:#aaa;margin-bottom:5px;">📂 {file_info}</div>
@@ -119,6 +176,6 @@ Provide ONLY the Korean translation."""
             </div>
             """, unsafe_allow_html=True)
             
-            # Rate Limit 방지를 위한 안전 딜레이 (0.5초)
-            await asyncio.sleep(0.5)
+            # Rate Limit 방지를 위한 안전 딜레이
+            await asyncio.sleep(GEMINI_CHUNK_DELAY)
     return out
\ No newline at end of file
@@ -1,3 +1,8 @@
+import os
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import streamlit as st
 import torch
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
@@ -6,26 +11,97 @@ import utils
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 MAX_NEW_TOKENS = 256
 
+# ======================
+# DECODE SETTINGS
+# ======================
+# 새 토큰 상한 = 배치 내 최장 원문 토큰 수 × 비율 + 여유 (MAX_NEW_TOKENS 이하)
+# → 짧은 감탄사 배치가 256 토큰까지 끌려가지 않음
+LENGTH_RATIO = 2.0
+LENGTH_PAD = 8
+DECODE_PRESETS = {
+    "greedy": {"num_beams": 1, "do_sample": False},
+    "beam": {"num_beams": 4, "do_sample": False, "early_stopping": True},
+}
+# 반복 폭주 방지 (한 줄이 폭주하면 배치 전체가 상한까지 디코딩됨)
+REPETITION_GUARD = {"no_repeat_ngram_size": 4, "repetition_penalty": 1.1}
+DECODE_MODE = os.getenv("NLLB_DECODE", "greedy")
+RETRY_DECODE = "beam"  # 검증 실패 줄 재번역: greedy를 다시 돌리면 같은 결과가 나오므로 beam
+# torch.compile + static KV cache (로드 시 워밍업, 실패하면 eager로 복귀)
+COMPILE = os.getenv("NLLB_COMPILE", "0") == "1"
+COMPILE_PAD_MULTIPLE = 16  # 입력 길이를 버킷으로 맞춰 재컴파일 최소화
+WARMUP_TEXTS = ["Hello.", "Where are you going tonight?", "I told you, I was at the office until midnight."]
+
+# GPU 없는 다코어 노드용: 모델 사본을 가진 워커 프로세스 N개로 샤딩 (0/1이면 비활성)
+CPU_WORKERS = int(os.getenv("NLLB_CPU_WORKERS", "0"))
+CPU_BATCH_SIZE = 8  # CPU는 작은 배치를 여러 프로세스에 나누는 편이 빠름
+
 @st.cache_resource
-def load_model(model_id):
-    # 품질 최우선: 압축 없이 FP16 로드
+def load_model(model_id, compile=COMPILE):
+    return _load(model_id, DEVICE, compile)
+
+def _load(model_id, device, compile=False):
     tok = AutoTokenizer.from_pretrained(model_id)
-    mdl = AutoModelForSeq2SeqLM.from_pretrained(
-        model_id,
-        torch_dtype=torch.float16,
-        device_map="cuda",  # 강제 CUDA 할당
-        low_cpu_mem_usage=True
-    )
+    if device == "cuda":
+        # 품질 최우선: 압축 없이 FP16 로드
+        mdl = AutoModelForSeq2SeqLM.from_pretrained(
+            model_id,
+            torch_dtype=torch.float16,
+            device_map="cuda",  # 강제 CUDA 할당
+            low_cpu_mem_usage=True
+        )
+    else:
+        mdl = AutoModelForSeq2SeqLM.from_pretrained(model_id, low_cpu_mem_usage=True)
     mdl.eval()
+    if compile and hasattr(torch, "compile"):
+        _compile(mdl)
+    warmup(tok, mdl, device)
     return tok, mdl
 
-def translate(rows, tok, mdl, status, file_info, file_idx, total_files):
+def _compile(mdl):
+    mdl._eager_forward = mdl.forward
+    mdl.generation_config.cache_implementation = "static"
+    mdl.forward = torch.compile(mdl.forward, mode="reduce-overhead", fullgraph=False)
+    mdl._nllb_compiled = True
+
+def _uncompile(mdl):
+    mdl.forward = mdl._eager_forward
+    mdl.generation_config.cache_implementation = None
+    mdl._nllb_compiled = False
+
+def warmup(tok, mdl, device):
+    """첫 요청 지연(CUDA 커널 로딩/컴파일)을 모델 로드 시점으로 당김.
+    compile 경로가 이 모델/버전에서 동작하지 않으면 eager로 되돌림"""
+    try:
+        for mode in DECODE_PRESETS:
+            _generate(tok, mdl, WARMUP_TEXTS, device, mode)
+    except Exception:
+        if not getattr(mdl, "_nllb_compiled", False): raise
+        _uncompile(mdl)
+        for mode in DECODE_PRESETS:
+            _generate(tok, mdl, WARMUP_TEXTS, device, mode)
+
+def decode_kwargs(inputs, mode=DECODE_MODE, pad_multiple=None):
+    """배치 원문 길이에 맞춘 generate() 인자.
+    pad_multiple이 주어지면(compile 경로) static KV cache 길이가 배치마다 바뀌어
+    재컴파일되지 않도록 max_new_tokens를 그 배수로 올림"""
+    src_len = int(inputs["attention_mask"].sum(dim=1).max())
+    max_new = int(src_len * LENGTH_RATIO) + LENGTH_PAD
+    if pad_multiple: max_new = -(-max_new // pad_multiple) * pad_multiple
+    max_new = min(MAX_NEW_TOKENS, max_new)
+    return {**DECODE_PRESETS[mode], **REPETITION_GUARD, "max_new_tokens": max_new}
+
+def translate(rows, tok, mdl, status, file_info, file_idx, total_files, pool=None, on_rows=None, decode=DECODE_MODE,
+              only=None):
+    # pool(CpuPool)이 주어지면 tok/mdl 대신 워커 프로세스들이 번역
+    # on_rows([(행 인덱스, 번역), ...])는 배치마다 호출 (파이프라인 다음 단계로 스트리밍)
+    # only(인덱스 집합)가 주어지면 그 줄만 번역 (검증 실패 재시도)
     texts = [r[2] for r in rows]
     out = texts[:]
     todo_map = {}
     translation_cache = {}
 
     for i, t in enumerate(texts):
+        if only is not None and i not in only: continue
         cleaned = utils.clean_text(t)
         if not cleaned: continue
         if cleaned in translation_cache:
@@ -33,44 +109,144 @@ def translate(rows, tok, mdl, status, file_info, file_idx, total_files):
         else:
             todo_map.setdefault(cleaned, []).append(i)
 
-    unique_texts = list(todo_map.keys())
     unique_texts = list(todo_map.keys())
     batch_size = 64  # RTX 5080: 고성능 배칭
-    
-    for p in range(0, len(unique_texts), batch_size):
-        batch_src = unique_texts[p : p + batch_size]
-        src_lang, _ = utils.detect_language(batch_src[0])
-        tok.src_lang = src_lang
-
-        with torch.no_grad():
-            inputs = tok(batch_src, return_tensors="pt", padding=True).to(DEVICE)
-            gen = mdl.generate(**inputs, forced_bos_token_id=tok.convert_tokens_to_ids("kor_Hang"), max_new_tokens=MAX_NEW_TOKENS)
-            results = tok.batch_decode(gen, skip_special_tokens=True)
 
+    def on_batch(done, batch_src, results):
+        finished = []
         for src, res in zip(batch_src, results):
             translation_cache[src] = res
             for idx in todo_map[src]:
                 out[idx] = res
+            finished.extend((idx, res) for idx in todo_map[src])
+        if on_rows: on_rows(finished)
+        _render_status(status, done, len(unique_texts), file_info, file_idx, total_files, batch_src[-1], results[-1])
 
-        u_vram, t_vram = utils.get_vram_status()
-        status.markdown(f"""
-        <div style="background:#1e1e1e;padding:15px;border-radius:12px;border:1px solid #7df9ff; box-shadow: 0 4px 6px rgba(0,0,0,0.3);">
-        <div style="display:flex;align-items:center;gap:10px;margin-bottom:10px;">
-            <h4 style="margin:0;color:#7df9ff;">🚀 NLLB 3.3B (RTX 5080 Extreme)</h4>
-            <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">{min(p+len(batch_src), len(unique_texts))}/{len(unique_texts)}</span>
-            <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">File {file_idx}/{total_files}</span>
-            <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#888;">VRAM: {u_vram:.1f}GB</span>
-        </div>
-        <div style="font-size:0.9em;color:#aaa;margin-bottom:5px;">📂 {file_info}</div>
-        <div style="background:#2d2d2d;padding:10px;border-radius:8px;margin-bottom:8px;">
-            <span style="color:#888;font-size:0.85em;">Original</span><br>
-            <span style="color:#eee;">{utils.clean_text(batch_src[-1])}</span>
-        </div>
-        <div style="background:#263238;padding:10px;border-radius:8px;border-left:4px solid #7df9ff;">
-            <span style="color:#7df9ff;font-size:0.85em;">Translated</span><br>
-            <span style="color:#fff;font-weight:bold;">{utils.clean_text(results[-1])}</span>
-        </div>
-        </div>
-        """, unsafe_allow_html=True)
+    if pool is not None:
+        pool.run(unique_texts, on_batch, decode)
+        return out
+
+    for p in range(0, len(unique_texts), batch_size):
+        batch_src = unique_texts[p : p + batch_size]
+        results = _generate(tok, mdl, batch_src, DEVICE, decode)
+        on_batch(min(p + len(batch_src), len(unique_texts)), batch_src, results)
         
-    return out
\ No newline at end of file
+    return out
+
+def _generate(tok, mdl, batch_src, device, decode=DECODE_MODE):
+    src_lang, _ = utils.detect_language(batch_src[0])
+    tok.src_lang = src_lang
+    pad_multiple = COMPILE_PAD_MULTIPLE if getattr(mdl, "_nllb_compiled", False) else None
+
+    with torch.no_grad():
+        inputs = tok(batch_src, return_tensors="pt", padding=True, pad_to_multiple_of=pad_multiple).to(device)
+        gen = mdl.generate(**inputs, forced_bos_token_id=tok.convert_tokens_to_ids("kor_Hang"), **decode_kwargs(inputs, decode, pad_multiple))
+        return tok.batch_decode(gen, skip_special_tokens=True)
+
+def _render_status(status, done, total, file_info, file_idx, total_files, src, res):
+    u_vram, t_vram = utils.get_vram_status()
+    status.markdown(f"""
+    <div style="background:#1e1e1e;padding:15px;border-radius:12px;border:1px solid #7df9ff; box-shadow: 0 4px 6px rgba(0,0,0,0.3);">
+    <div style="display:flex;align-items:center;gap:10px;margin-bottom:10px;">
+        <h4 style="margin:0;color:#7df9ff;">🚀 NLLB 3.3B (RTX 5080 Extreme)</h4>
+        <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">{done}/{total}</span>
+        <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#eee;">File {file_idx}/{total_files}</span>
+        <span style="background:#333;padding:4px 8px;border-radius:4px;font-size:0.8em;color:#888;">VRAM: {u_vram:.1f}GB</span>
+    </div>
+    <div style="font-size:0.9em;color:#aaa;margin-bottom:5px;">📂 {file_info}</div>
+    <div style="background:#2d2d2d;padding:10px;border-radius:8px;margin-bottom:8px;">
+        <span style="color:#888;font-size:0.85em;">Original</span><br>
+        <span style="color:#eee;">{utils.clean_text(src)}</span>
+    </div>
+    <div style="background:#263238;padding:10px;border-radius:8px;border-left:4px solid #7df9ff;">
+        <span style="color:#7df9ff;font-size:0.85em;">Translated</span><br>
+        <span style="color:#fff;font-weight:bold;">{utils.clean_text(res)}</span>
+    </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+# ======================
+# CPU MULTI-PROCESS SHARDING
+# ======================
+CPU_INIT_TIMEOUT = 1800  # 워커 모델 로드 + 워밍업 대기 한도 (초)
+
+_worker_tok = None
+_worker_mdl = None
+
+def available_cores():
+    """이 프로세스가 실제로 쓸 수 있는 코어 수 (cgroup/taskset 제한 반영)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def _init_worker(model_id, threads, rank):
+    """워커 프로세스 초기화: 스레드 수 고정 + (Linux) 코어 고정 + CPU 모델 로드"""
+    global _worker_tok, _worker_mdl
+    with rank.get_lock():
+        my_rank = rank.value
+        rank.value += 1
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    if hasattr(os, "sched_setaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+        mine = cores[my_rank * threads:(my_rank + 1) * threads]
+        if mine: os.sched_setaffinity(0, mine)
+    _worker_tok = AutoTokenizer.from_pretrained(model_id)
+    _worker_mdl = AutoModelForSeq2SeqLM.from_pretrained(model_id, low_cpu_mem_usage=True)
+    _worker_mdl.eval()
+    warmup(_worker_tok, _worker_mdl, "cpu")
+
+def _worker_ready():
+    return os.getpid()
+
+def _worker_generate(args):
+    batch_src, decode = args
+    return _generate(_worker_tok, _worker_mdl, batch_src, "cpu", decode)
+
+class CpuPool:
+    """모델 사본을 가진 워커 프로세스 풀. 고유 문장을 배치 단위로 나눠 분산하고 순서대로 수집.
+    ProcessPoolExecutor는 워커 로드 실패나 작업 중 워커 사망(OOM 등) 시 BrokenProcessPool을 던지므로
+    (multiprocessing.Pool은 워커를 다시 띄우며 무한 대기) 작업이 실패로 끝나고 풀은 폐기됨"""
+    def __init__(self, model_id, workers, batch_size=CPU_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.threads = max(1, available_cores() // workers)
+        self.broken = False
+        ctx = mp.get_context("spawn")  # fork는 torch 스레드 풀과 충돌
+        self.pool = ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker,
+                                        initargs=(model_id, self.threads, ctx.Value("i", 0)))
+        # 워커를 미리 모두 띄워 모델 로드를 기다림: 하나라도 실패하면 풀을 닫고 작업을 실패 처리
+        try:
+            for f in [self.pool.submit(_worker_ready) for _ in range(workers)]:
+                f.result(timeout=CPU_INIT_TIMEOUT)
+        except Exception as e:
+            self.close(broken=True)
+            raise RuntimeError(f"NLLB CPU workers failed to load {model_id}: {type(e).__name__}: {e}") from e
+
+    def run(self, texts, on_batch=None, decode=DECODE_MODE):
+        batches = [texts[p : p + self.batch_size] for p in range(0, len(texts), self.batch_size)]
+        results, done = [], 0
+        try:
+            for batch_src, res in zip(batches, self.pool.map(_worker_generate, [(b, decode) for b in batches])):
+                done += len(batch_src)
+                results.extend(res)
+                if on_batch: on_batch(done, batch_src, res)
+        except BrokenProcessPool:
+            self.close(broken=True)
+            raise
+        return results
+
+    def close(self, broken=False):
+        self.broken = self.broken or broken
+        self.pool.shutdown(wait=not broken, cancel_futures=True)
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+def get_cpu_pool(model_id, workers=CPU_WORKERS):
+    """(model_id, workers)별 풀을 프로세스 내에서 재사용 (워커 모델 로딩은 최초 1회)"""
+    with _pool_lock:
+        key = (model_id, workers)
+        if key not in _pools or _pools[key].broken:  # 워커가 죽은 풀은 새로 생성
+            _pools[key] = CpuPool(model_id, workers)
+        return _pools[key]
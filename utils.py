@@ -53,10 +53,31 @@ def detect_language(text):
     lang, _ = langid.classify(text)
     return LANG_MAP.get(lang, "eng_Latn"), lang
 
+def is_korean(text):
+    return bool(re.search(r"[가-힣]", text or ""))
+
 def clean_text(t):
     if not t: return ""
     return re.sub(r"[\x00-\x1f]", "", t).strip()
 
+def number_lines(texts):
+    """여러 줄을 한 요청에 보낼 때: [1] ..., [2] ... 형식"""
+    return "\n".join(f"[{k}] {t}" for k, t in enumerate(texts, 1))
+
+def parse_numbered(text, n):
+    """number_lines 형식 응답 → 길이 n 리스트 (빠진 번호는 None)"""
+    out = [None] * n
+    for line in (text or "").splitlines():
+        m = re.match(r"\s*\[(\d+)\]\s*(.*)", line)
+        if m and 1 <= int(m.group(1)) <= n and out[int(m.group(1)) - 1] is None:
+            out[int(m.group(1)) - 1] = m.group(2).strip()
+    return out
+
+def select_targets(texts, polish_ko=False):
+    """번역(또는 교정) 대상 인덱스: 번역 모드는 한국어가 아닌 줄, 교정 모드는 한국어 줄"""
+    return [i for i, t in enumerate(texts)
+            if clean_text(t) and is_korean(clean_text(t)) == bool(polish_ko)]
+
 def parse_srt(txt):
     blocks = re.split(r"\n\s*\n", txt.strip())
     rows = []
@@ -88,4 +109,121 @@ def get_vram_status():
         return 0, 0
     used = torch.cuda.memory_allocated()
     total = torch.cuda.get_device_properties(0).total_memory
-    return used / 1024**3, total / 1024**3
\ No newline at end of file
+    return used / 1024**3, total / 1024**3
+
+# ======================
+# LATENCY STATS (예상 소요 시간 계산용)
+# ======================
+_latency = {}
+
+def record_latency(engine, seconds, alpha=0.2):
+    """엔진별 요청 지연시간 지수이동평균 기록"""
+    prev = _latency.get(engine)
+    _latency[engine] = seconds if prev is None else prev + alpha * (seconds - prev)
+
+def get_latency(engine, default):
+    return _latency.get(engine, default)
+
+# ======================
+# SENTENCE MERGE / SPLIT
+# ======================
+MERGE_MAX_GAP_MS = 1000   # 이 간격보다 멀리 떨어진 큐는 다른 문장으로 간주
+MERGE_MAX_CHARS = 200     # 병합 단위 최대 길이
+MERGE_MAX_CUES = 4        # 한 단위로 묶을 최대 큐 수
+TERMINAL_PUNCT = (".", "?", "!", "…", "。", "？", "！", "♪", '"', "'", ")", "]")
+
+def parse_timecode(tc):
+    """'00:00:01,000 --> 00:00:02,500' 형식을 (시작ms, 끝ms)로 변환. 실패 시 None"""
+    m = re.findall(r"(\d+):(\d+):(\d+)[,.](\d+)", tc or "")
+    if len(m) < 2: return None
+    to_ms = lambda h, mi, s, ms: ((int(h) * 60 + int(mi)) * 60 + int(s)) * 1000 + int(ms.ljust(3, "0")[:3])
+    return to_ms(*m[0]), to_ms(*m[1])
+
+def _continues(prev_row, next_row, prev_text, group_len):
+    """prev 큐의 문장이 next 큐로 이어지는지 판단"""
+    a, b = parse_timecode(prev_row[1]), parse_timecode(next_row[1])
+    if not a or not b: return False
+    nxt = clean_text(next_row[2])
+    if not prev_text or not nxt: return False
+    if prev_text.endswith(TERMINAL_PUNCT): return False
+    if nxt.startswith(("-", "♪", "[", "(")): return False  # 화자 전환 / 효과음
+    if b[0] - a[1] > MERGE_MAX_GAP_MS: return False
+    if group_len >= MERGE_MAX_CUES: return False
+    return len(prev_text) + 1 + len(nxt) <= MERGE_MAX_CHARS
+
+def merge_cues(rows):
+    """한 문장이 여러 큐로 나뉜 경우 하나의 번역 단위로 병합.
+    반환: (units, groups) - units는 parse_srt와 같은 [idx, tc, text] 형식,
+    groups[u]는 단위 u를 구성하는 원본 rows 인덱스 목록"""
+    units, groups = [], []
+    for i, r in enumerate(rows):
+        if groups and _continues(rows[groups[-1][-1]], r, clean_text(units[-1][2]), len(groups[-1])):
+            groups[-1].append(i)
+            units[-1][2] = f"{clean_text(units[-1][2])} {clean_text(r[2])}"
+        else:
+            groups.append([i])
+            units.append([r[0], r[1], r[2]])
+    return units, groups
+
+def _split_weights(rows, group):
+    """재분할 비율: 큐 길이(시간)와 원문 글자 수를 반반 반영"""
+    durs = []
+    for i in group:
+        t = parse_timecode(rows[i][1])
+        durs.append(max(t[1] - t[0], 1) if t else 1)
+    chars = [max(len(clean_text(rows[i][2])), 1) for i in group]
+    return [0.5 * d / sum(durs) + 0.5 * c / sum(chars) for d, c in zip(durs, chars)]
+
+def split_text(text, weights):
+    """번역문을 단어 경계에서 weights 비율대로 나눔.
+    단어 수가 큐 수보다 적으면 빈 큐가 생기므로 None"""
+    k = len(weights)
+    words = text.split()
+    if k == 1: return [text]
+    if len(words) < k: return None
+
+    cum_len, acc = [0], 0
+    for n, w in enumerate(words):
+        acc += len(w) + (1 if n else 0)
+        cum_len.append(acc)
+
+    parts, start, target = [], 0, 0.0
+    for b in range(1, k):
+        target += weights[b - 1] * acc
+        lo, hi = start + 1, len(words) - (k - b)
+        cut = min(range(lo, hi + 1), key=lambda c: abs(cum_len[c] - target))
+        parts.append(" ".join(words[start:cut]))
+        start = cut
+    parts.append(" ".join(words[start:]))
+    return parts
+
+def _span_timecode(first_tc, last_tc):
+    """첫 큐 시작 ~ 마지막 큐 끝을 덮는 타임코드"""
+    return f"{first_tc.split('-->')[0].strip()} --> {last_tc.split('-->')[1].strip()}"
+
+def split_merged(rows, groups, units, unit_out):
+    """병합 단위의 번역 결과를 원래 큐 타임코드로 되돌려 분배. 반환: build_srt용 rows.
+    번역문이 큐 수만큼 나뉘지 않으면(짧은 한국어 문장) 빈 큐 대신 전체 구간을 덮는 큐 하나로 합침"""
+    out, collapsed = [], False
+    for group, unit, res in zip(groups, units, unit_out):
+        if len(group) == 1:
+            r = rows[group[0]]
+            out.append([r[0], r[1], res])
+            continue
+        if res == unit[2]:  # 번역되지 않은 단위는 원래 줄 구성 유지
+            out.extend([rows[i][0], rows[i][1], rows[i][2]] for i in group)
+            continue
+        parts = split_text(res, _split_weights(rows, group))
+        if parts is None:
+            first, last = rows[group[0]], rows[group[-1]]
+            out.append([first[0], _span_timecode(first[1], last[1]), res])
+            collapsed = True
+        else:
+            out.extend([rows[i][0], rows[i][1], part] for i, part in zip(group, parts))
+    if collapsed:  # 큐가 줄었으면 번호를 다시 매김
+        n = 0
+        for r in out:
+            if r[0]:
+                n += 1
+                r[0] = str(n)
+    return out
@@ -0,0 +1,107 @@
+import re
+import unicodedata
+from collections import Counter
+
+import numpy as np
+import utils
+
+# ======================
+# CONFIG
+# ======================
+# Claude prefill 에코 / LLM이 붙이는 라벨
+PREFILL_ECHOES = ("한국어 자막:", "다듬은 결과:", "번역 결과:", "번역:", "Korean:", "Translation:")
+# 출력/원문 글자 수 비율 허용 범위 (번역, 교정)
+RATIO_BOUNDS = {False: (0.1, 2.5), True: (0.5, 2.0)}
+MIN_CHECK_LEN = 6  # 이보다 짧은 원문("Oh!", "Hey")은 길이 검사 생략 (전각 문자는 2로 계산)
+# 가사/감탄사 추임새: 이것만으로 된 원문은 그대로 둬도 정상
+VOCABLES = {"la", "na", "da", "oh", "ah", "uh", "um", "mm", "hmm", "ooh", "whoa", "ha", "hey", "yeah"}
+RETRY_ENGINES = ("nllb", "gemini", "claude", "deepl", "nllb_gemini", "nllb_claude")  # 실패 줄만 다시 보낼 수 있는 엔진
+
+REASONS = ("empty", "untranslated", "wrong_script", "too_long", "too_short", "repeated")
+
+_MARKDOWN = re.compile(r"```[a-z]*\n?|\n?```|\*\*|__")
+_PREFILL = re.compile(r"^\s*(?:" + "|".join(map(re.escape, PREFILL_ECHOES)) + r")\s*")
+_QUOTED = re.compile(r'^["\'“‘「『](.*)["\'”’」』]$', re.S)
+_REPEAT = re.compile(r"(\S+)(?:\s+\1){2,}", re.I)  # 같은 단어(어절) 3번 이상 연속 → 디코딩 폭주
+_WORD = re.compile(r"[^\W\d_]+")  # 문자(모든 스크립트) 연속
+_MID_NAME = re.compile(r"(?<=[^\W\d_]|,) +([A-Z][a-z]+)\b")  # 문장 중간의 대문자 단어
+
+# ======================
+# CLEAN & CHECK
+# ======================
+def clean_output(text):
+    """prefill 에코, 마크다운, 전체를 감싼 따옴표 제거"""
+    if not text: return ""
+    t = _MARKDOWN.sub("", text).strip()
+    t = _PREFILL.sub("", t).strip()
+    m = _QUOTED.match(t)
+    return m.group(1).strip() if m else t
+
+def script_len(text):
+    """스크립트를 고려한 길이: 전각(한자/가나/한글) 문자는 라틴 문자 2개로 계산"""
+    return sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text)
+
+def proper_nouns(texts):
+    """문장 중간에 대문자로 나오는 단어 = 이름 후보 ("I saw John" → John)"""
+    return {m.group(1) for t in texts for m in _MID_NAME.finditer(utils.clean_text(t))}
+
+def keep_as_is(src, out, names=()):
+    """번역하지 않고 그대로 둬도 정상인 원문인지:
+    글자가 없거나("2019", "♪ ♪"), 추임새뿐이거나("♪ la la ♪"),
+    이름 한 단어이고 출력도 그 이름을 유지("John!" → "John!")"""
+    words = _WORD.findall(src)
+    if not words: return True
+    if all(w.lower() in VOCABLES for w in words): return True
+    return len(words) == 1 and words[0] in names and words[0] in out
+
+def validate(texts, outputs, polish_ko=False, only=None, names=None):
+    """작업 전체 출력을 한 번에 정리 + 검사. names: proper_nouns(texts) (반복 호출 시 미리 계산해 전달)
+    반환: (정리된 outputs, {인덱스: 실패 사유}, 검사한 줄 수)"""
+    idx = utils.select_targets(texts, polish_ko)  # 엔진이 번역한 줄만 검사
+    if only is not None: idx = [i for i in idx if i in only]
+    cleaned = list(outputs)
+    for i in idx:
+        cleaned[i] = clean_output(outputs[i])
+    if not idx: return cleaned, {}, 0
+
+    src = [utils.clean_text(texts[i]) for i in idx]
+    out = [utils.clean_text(cleaned[i]) for i in idx]
+    names = proper_nouns(texts) if names is None else names
+    src_len = np.fromiter(map(len, src), dtype=np.int64, count=len(idx))
+    out_len = np.fromiter(map(len, out), dtype=np.int64, count=len(idx))
+    korean = np.fromiter(map(utils.is_korean, out), dtype=bool, count=len(idx))
+    same = np.fromiter((o == s for o, s in zip(out, src)), dtype=bool, count=len(idx))
+    # 교정 모드 원문은 한국어이므로 항상 검사
+    lexical = np.fromiter((polish_ko or not keep_as_is(s, o, names) for s, o in zip(src, out)),
+                          dtype=bool, count=len(idx))
+
+    lo, hi = RATIO_BOUNDS[bool(polish_ko)]
+    ratio = out_len / np.maximum(src_len, 1)
+    checkable = np.fromiter(map(script_len, src), dtype=np.int64, count=len(idx)) >= MIN_CHECK_LEN
+    empty = out_len == 0
+    repeated = np.fromiter((bool(_REPEAT.search(o)) and not _REPEAT.search(s) for s, o in zip(src, out)),
+                           dtype=bool, count=len(idx))
+
+    reason = np.select(
+        [
+            empty,
+            same & lexical & (not polish_ko),  # 교정 모드는 그대로 두는 것도 정상
+            ~korean & lexical,
+            checkable & (ratio > hi),
+            checkable & (ratio < lo),
+            repeated,
+        ],
+        REASONS,
+        default="",
+    )
+    failures = {i: str(r) for i, r in zip(idx, reason) if r}
+    return cleaned, failures, len(idx)
+
+def summarize(report, checked, first, remaining):
+    """작업 리포트에 검증 통계 누적"""
+    report["checked"] = report.get("checked", 0) + checked
+    report["failed"] = report.get("failed", 0) + len(first)
+    report["remaining"] = report.get("remaining", 0) + len(remaining)
+    reasons = Counter(report.get("reasons", {}))
+    reasons.update(first.values())
+    report["reasons"] = dict(reasons)